@@ -79,9 +79,14 @@ only convert features between a subset of formats.
 __version__ = '2.0.7'
 
 from collections import OrderedDict
+import copy_reg
 import re
 import os
 import random
+import hashlib
+import threading
+import weakref
+from multiprocessing.pool import ThreadPool
 try:
     from cStringIO import StringIO
 except ImportError:
@@ -100,6 +105,290 @@ def _clean_filename(name):
     return re.sub("[^\w .]", "", name)
 
 
+class _Slotted(object):
+    """Base for compact classes which store their attributes in
+    ``__slots__`` rather than an instance ``__dict__``.
+
+    Scripts can contain a great many of these objects, so dropping the
+    per-instance dict saves a lot of memory. Slotted classes can't be pickled
+    with the older protocols by default, so provide the state explicitly.
+
+    """
+
+    __slots__ = ()
+
+    def __getstate__(self):
+        state = dict(getattr(self, '__dict__', {}))
+        for cls in self.__class__.__mro__:
+            for name in cls.__dict__.get('__slots__', ()):
+                if hasattr(self, name):
+                    state[name] = getattr(self, name)
+        return state
+
+    def __setstate__(self, state):
+        for (name, value) in state.items():
+            setattr(self, name, value)
+
+
+def _tracked(method):
+    def wrapper(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        self._changed()
+        return result
+    wrapper.__name__ = method.__name__
+    return wrapper
+
+
+class _TrackedList(list):
+    """A list which calls ``_changed()`` on its owner whenever it is
+    modified.
+
+    Pickles and copies as a plain list.
+
+    """
+
+    __slots__ = ('_owner',)
+
+    def __init__(self, owner, items=()):
+        list.__init__(self, items)
+        self._owner = owner
+
+    def __reduce__(self):
+        return (list, (list(self),))
+
+    def _changed(self):
+        self._owner._changed()
+
+    __setitem__ = _tracked(list.__setitem__)
+    __delitem__ = _tracked(list.__delitem__)
+    __setslice__ = _tracked(list.__setslice__)
+    __delslice__ = _tracked(list.__delslice__)
+    __iadd__ = _tracked(list.__iadd__)
+    __imul__ = _tracked(list.__imul__)
+    append = _tracked(list.append)
+    extend = _tracked(list.extend)
+    insert = _tracked(list.insert)
+    pop = _tracked(list.pop)
+    remove = _tracked(list.remove)
+    reverse = _tracked(list.reverse)
+    sort = _tracked(list.sort)
+
+
+class _ArgList(_TrackedList):
+    """The :attr:`Block.args` list of a block.
+
+    Lists put into it, such as the stack of blocks in a C-block, are stored as
+    tracked copies, so changes to them are reported too.
+
+    """
+
+    __slots__ = ()
+
+    def __init__(self, owner, items=()):
+        _TrackedList.__init__(self, owner)
+        list.extend(self, map(self._track, items))
+
+    def _track(self, value):
+        if isinstance(value, list):
+            return _TrackedList(self._owner, value)
+        return value
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            value = map(self._track, value)
+        else:
+            value = self._track(value)
+        list.__setitem__(self, index, value)
+        self._changed()
+
+    def __setslice__(self, i, j, values):
+        list.__setslice__(self, i, j, map(self._track, values))
+        self._changed()
+
+    def __iadd__(self, values):
+        list.extend(self, map(self._track, values))
+        self._changed()
+        return self
+
+    def append(self, value):
+        list.append(self, self._track(value))
+        self._changed()
+
+    def extend(self, values):
+        list.extend(self, map(self._track, values))
+        self._changed()
+
+    def insert(self, index, value):
+        list.insert(self, index, self._track(value))
+        self._changed()
+
+
+class _IndexedList(_TrackedList):
+    """A list which can find its items by identity or by ``name`` in constant
+    time.
+
+    The indexes are rebuilt lazily after the list is modified, or after any
+    indexed object is renamed (see :func:`_renamed`).
+
+    Items are compared by identity, which is how the classes stored in these
+    lists compare anyway.
+
+    """
+
+    __slots__ = ('_positions', '_names', '_names_generation')
+
+    def __init__(self, items=()):
+        _TrackedList.__init__(self, None, items)
+        self._changed()
+
+    def __reduce__(self):
+        return (_IndexedList, (list(self),))
+
+    def _changed(self):
+        self._positions = None
+        self._names = None
+
+    def _get_positions(self):
+        if self._positions is None:
+            self._positions = {}
+            for (i, item) in enumerate(self):
+                self._positions.setdefault(id(item), i)
+        return self._positions
+
+    def __contains__(self, item):
+        return id(item) in self._get_positions()
+
+    def index(self, item, *args):
+        if args:
+            return list.index(self, item, *args)
+        try:
+            return self._get_positions()[id(item)]
+        except KeyError:
+            raise ValueError("%r is not in list" % (item,))
+
+    def get_by_name(self, name):
+        """Return the first item with the given name, or None."""
+        if self._names is None or self._names_generation != _renamed.count:
+            self._names = {}
+            for item in self:
+                self._names.setdefault(getattr(item, 'name', None), item)
+            self._names_generation = _renamed.count
+        return self._names.get(name)
+
+
+def _renamed():
+    """Call when an object that can be stored in an :class:`_IndexedList`
+    changes its name.
+
+    New objects don't need to call this, since they can't be in a list yet.
+
+    """
+    _renamed.count += 1
+_renamed.count = 0
+
+
+def _indexed(items):
+    """Return ``items`` as an :class:`_IndexedList`.
+
+    Lists which are already indexed are used as-is, so ``+=`` works; other
+    sequences are copied.
+
+    """
+    if isinstance(items, _IndexedList):
+        return items
+    return _IndexedList(items)
+
+
+class _TextWriter(object):
+    """Writes the text of scripts in one pass, for :meth:`Script.stringify`.
+
+    Lines inside C block mouths are indented as they're written, and block
+    comments are put at the end of the block's first line once it's known,
+    so strings never have to be rewritten.
+
+    :param write: Called with each chunk of text, eg. ``fp.write``.
+
+    """
+
+    def __init__(self, write):
+        self._write = write
+
+        self.indent = ""
+        """Written after each newline."""
+
+        self.column = 0
+        """The number of characters written since the last newline."""
+
+        self.comments = []
+        """``(column, text)`` for each block comment waiting to be written at
+        the next newline, where column is the start of the block."""
+
+    def write(self, text):
+        start = 0
+        end = text.find("\n")
+        while end != -1:
+            self._write(text[start:end])
+            self.column += end - start
+            self.newline()
+            start = end + 1
+            end = text.find("\n", start)
+        if start:
+            text = text[start:]
+        self._write(text)
+        self.column += len(text)
+
+    def newline(self):
+        while self.comments:
+            self.write_comment(*self.comments.pop())
+        self._write("\n" + self.indent)
+        self.column = len(self.indent)
+
+    def write_comment(self, column, text):
+        indent = "\n" + " " * (self.column - column) + " // "
+        self.write(" // " + text.replace("\n", indent))
+
+
+def _stringify(write_text, *args):
+    """Return the text written by ``write_text(writer, *args)``."""
+    chunks = []
+    write_text(_TextWriter(chunks.append), *args)
+    return "".join(chunks)
+
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    """Return the thread pool for :attr:`Project.load_async`, starting it if
+    it hasn't been used yet."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPool()
+    return _pool
+
+def _sniff(fp):
+    """Return the plugin which recognises the file, or None."""
+    start = fp.tell()
+    header = fp.read(kurt.plugin.SNIFF_SIZE)
+    fp.seek(start)
+    return kurt.plugin.Kurt.sniff(header)
+
+def _load_from(cls, path, format):
+    if not isinstance(path, basestring) and not hasattr(path, "read"):
+        path = StringIO("".join(path))
+    return cls.load(path, format)
+
+def _save_to(project, path, warnings):
+    if callable(path):
+        fp = StringIO()
+        project.save(fp, warnings=warnings)
+        path(fp.getvalue())
+        return None
+    return project.save(path, warnings=warnings)
+
+
 
 #-- Project: main class --#
 
@@ -161,22 +450,7 @@ class Project(object):
         """The :class:`Stage`."""
 
         self.sprites = []
-        """List of :class:`Sprites <Sprite>`.
-
-        Use :attr:`get_sprite` to get a sprite by name.
-
-        """
-
         self.actors = []
-        """List of each :class:`Actor` on the stage.
-
-        Includes :class:`Watchers <Watcher>` as well as :class:`Sprites
-        <Sprite>`.
-
-        Sprites in :attr:`sprites` but not in actors will be added to actors on
-        save.
-
-        """
 
         self.variables = {}
         """:class:`dict` of global :class:`Variables <Variable>` by name."""
@@ -206,15 +480,81 @@ class Project(object):
         return "<%s.%s()>" % (self.__class__.__module__,
                 self.__class__.__name__)
 
+    @property
+    def sprites(self):
+        """List of :class:`Sprites <Sprite>`.
+
+        Use :attr:`get_sprite` to get a sprite by name.
+
+        """
+        return self._sprites
+
+    @sprites.setter
+    def sprites(self, value):
+        self._sprites = _indexed(value)
+
+    @property
+    def actors(self):
+        """List of each :class:`Actor` on the stage.
+
+        Includes :class:`Watchers <Watcher>` as well as :class:`Sprites
+        <Sprite>`.
+
+        Sprites in :attr:`sprites` but not in actors will be added to actors on
+        save.
+
+        """
+        return self._actors
+
+    @actors.setter
+    def actors(self, value):
+        self._actors = _indexed(value)
+
     def get_sprite(self, name):
         """Get a sprite from :attr:`sprites` by name.
 
         Returns None if the sprite isn't found.
 
         """
-        for sprite in self.sprites:
-            if sprite.name == name:
-                return sprite
+        return self.sprites.get_by_name(name)
+
+    def parse(self, text, workers=None):
+        """Parse a document containing many scripts, and add them to the
+        :attr:`scripts <Scriptable.scripts>` of the stage and sprites.
+
+        Scripts are separated by empty lines. A heading line such as ``==
+        Sprite1 ==`` means the scripts after it are for that sprite. Scripts
+        before the first heading are added to the stage. See
+        :meth:`kurt.text.Parser.parse_many`.
+
+        :param workers: If given, parse in this many processes at once.
+
+        """
+        parser = kurt.text.Parser(self.stage)
+        for (scriptable, script) in parser.parse_many(text, workers=workers):
+            scriptable.scripts.append(script)
+
+    def dump_text(self, fp, block_plugin=False):
+        """Write the scripts of the stage and every sprite to the file-like
+        object fp.
+
+        Each scriptable gets a heading line such as ``== Sprite1 ==``, and
+        scripts are separated by empty lines, in the format read by
+        :meth:`parse`. Comments are written as lines starting with ``//``.
+
+        The text is written as it's generated, so the whole project is never
+        held in memory as a string.
+
+        """
+        writer = _TextWriter(fp.write)
+        for scriptable in [self.stage] + self.sprites:
+            writer.write(u"== %s ==\n" % scriptable.name)
+            for script in scriptable.scripts:
+                if isinstance(script, Script):
+                    script._write_text(writer, block_plugin)
+                else:
+                    writer.write(script.stringify())
+                writer.write("\n\n")
 
     @property
     def format(self):
@@ -234,17 +574,21 @@ class Project(object):
 
         Use ``format`` to specify the file format to use.
 
-        Path can be a file-like object, in which case format is required.
-        Otherwise, can guess the appropriate format from the extension.
+        Otherwise, the format is recognised from the first few bytes of the
+        file, using :attr:`KurtPlugin.sniff`. If no plugin recognises it, the
+        format is guessed from the extension.
+
+        Path can be a file-like object, in which case it must be seekable
+        unless you give the format.
 
         If you pass a file-like object, you're responsible for closing the
         file.
 
         :param path:   Path or file pointer.
         :param format: :attr:`KurtFileFormat.name` eg. ``"scratch14"``.
-                       Overrides the extension.
+                       Overrides the contents and the extension.
 
-        :raises: :class:`UnknownFormat` if the extension is unrecognised.
+        :raises: :class:`UnknownFormat` if the file is unrecognised.
         :raises: :py:class:`ValueError` if the format doesn't exist.
 
         """
@@ -252,29 +596,62 @@ class Project(object):
         if path_was_string:
             (folder, filename) = os.path.split(path)
             (name, extension) = os.path.splitext(filename)
-            if format is None:
-                plugin = kurt.plugin.Kurt.get_plugin(extension=extension)
-                if not plugin:
-                    raise UnknownFormat(extension)
             fp = open(path, "rb")
         else:
             fp = path
-            assert format, "Format is required"
-            plugin = kurt.plugin.Kurt.get_plugin(format)
 
-        if not plugin:
-            raise ValueError, "Unknown format %r" % format
+        try:
+            if format:
+                plugin = kurt.plugin.Kurt.get_plugin(format)
+            else:
+                plugin = _sniff(fp)
+                if not plugin and path_was_string:
+                    try:
+                        plugin = kurt.plugin.Kurt.get_plugin(
+                                extension=extension)
+                    except ValueError:
+                        pass
+                if not plugin:
+                    raise UnknownFormat(extension if path_was_string
+                                        else "unrecognised file")
 
-        project = plugin.load(fp)
-        if path_was_string:
-            fp.close()
+            project = plugin.load(fp)
+        finally:
+            if path_was_string:
+                fp.close()
         project.convert(plugin)
-        if isinstance(path, basestring):
+        if path_was_string:
             project.path = path
             if not project.name:
                 project.name = name
         return project
 
+    @classmethod
+    def from_bytes(cls, data, format=None):
+        """Load project from the contents of a file.
+
+        :param data:   String with the contents of the file.
+        :param format: :attr:`KurtFileFormat.name` eg. ``"scratch14"``. By
+                       default, the format is worked out from the first few
+                       bytes of ``data``.
+
+        :raises: :class:`UnknownFormat` if the format can't be worked out.
+
+        """
+        return cls.load(StringIO(data), format)
+
+    def to_bytes(self, format=None, warnings=None):
+        """Save project, and return the contents of the file as a string.
+
+        :param format:   :attr:`KurtFileFormat.name` eg. ``"scratch14"``.
+                         Defaults to the current :attr:`format`.
+        :param warnings: See :attr:`save`.
+
+        """
+        fp = StringIO()
+        self.save(fp, warnings=warnings, format=format)
+        return fp.getvalue()
+
     def copy(self):
         """Return a new Project instance, deep-copying all the attributes."""
         p = Project()
@@ -325,7 +702,7 @@ class Project(object):
         self._plugin = kurt.plugin.Kurt.get_plugin(format)
         return list(self._normalize())
 
-    def save(self, path=None, debug=False):
+    def save(self, path=None, debug=False, warnings=None, format=None):
         """Save project to file.
 
         :param path: Path or file pointer.
@@ -342,8 +719,7 @@ class Project(object):
                      extension of the current plugin.
 
                      (Note that log output for the conversion will be printed
-                     to stdout. If you want to deal with the output, call
-                     :attr:`convert` directly.)
+                     to stdout, unless you pass ``warnings``.)
 
                      If the path ends in a folder instead of a file, the
                      filename is based on the project's :attr:`name`.
@@ -351,6 +727,14 @@ class Project(object):
         :param debug: If true, return debugging information from the format
                       plugin instead of the path.
 
+        :param warnings: A list to append the :class:`UnsupportedFeature`
+                         objects from the conversion to, instead of printing
+                         them.
+
+        :param format: :attr:`KurtFileFormat.name` eg. ``"scratch14"``.
+                       Overrides the extension, and the current format when
+                       saving to a file pointer.
+
         :raises: :py:class:`ValueError` if there's no path or name.
 
         :returns: path to the saved file.
@@ -359,6 +743,8 @@ class Project(object):
 
         p = self.copy()
         plugin = p._plugin
+        if format:
+            plugin = kurt.plugin.Kurt.get_plugin(format)
 
         # require path
         p.path = path or self.path
@@ -371,7 +757,7 @@ class Project(object):
             (name, extension) = os.path.splitext(filename)
 
             # get plugin from extension
-            if path: # only if not using self.path
+            if path and not format: # only if not using self.path
                 try:
                     plugin = kurt.plugin.Kurt.get_plugin(extension=extension)
                 except ValueError:
@@ -395,7 +781,13 @@ class Project(object):
             raise ValueError, "must convert project to a format before saving"
 
         for m in p.convert(plugin):
-            print m
+            if warnings is None:
+                print m
+            else:
+                warnings.append(m)
+        for (scriptable, normalized) in zip([self.stage] + self.sprites,
+                                            [p.stage] + p.sprites):
+            scriptable._adopt_normalized(normalized)
         result = p._save(fp)
         if path:
             fp.close()
@@ -404,6 +796,86 @@ class Project(object):
     def _save(self, fp):
         return self._plugin.save(fp, self)
 
+    @classmethod
+    def load_snapshot(cls, path):
+        """Load a project saved by :attr:`save_snapshot`.
+
+        This is much faster than loading the original file. See
+        :mod:`kurt.snapshot`.
+
+        :param path: Path or file pointer.
+
+        :raises: :py:class:`ValueError` if the file isn't a snapshot from this
+                 version of Kurt.
+
+        """
+        if isinstance(path, basestring):
+            with open(path, "rb") as fp:
+                return kurt.snapshot.load(fp)
+        return kurt.snapshot.load(path)
+
+    def save_snapshot(self, path):
+        """Save a binary snapshot of the project, to cache it for
+        :attr:`load_snapshot`.
+
+        Unlike :attr:`save`, the project isn't converted: it's restored
+        exactly as it is, including its :attr:`format`.
+
+        :param path: Path or file pointer.
+
+        """
+        if isinstance(path, basestring):
+            with open(path, "wb") as fp:
+                kurt.snapshot.save(self, fp)
+        else:
+            kurt.snapshot.save(self, path)
+
+    @classmethod
+    def load_async(cls, path, format=None, pool=None, callback=None):
+        """Load project from file in the background, so the calling thread
+        isn't blocked while the file is read and parsed.
+
+        Takes the same arguments as :attr:`load`, but ``path`` can also be an
+        iterable of strings with the contents of the file, such as the chunks
+        of an upload. As with a file pointer, ``format`` is then required. The
+        chunks are read in the background too.
+
+        :param pool:     A :py:class:`multiprocessing.pool.ThreadPool` to load
+                         the project in. Defaults to a pool shared by
+                         :attr:`load_async` and :attr:`save_async`, with a
+                         thread for each CPU.
+        :param callback: Called with the project once it's loaded, from one of
+                         the pool's threads.
+
+        :returns: a :py:class:`multiprocessing.pool.AsyncResult`. Its
+                  ``get()`` method waits for the project and returns it, or
+                  raises the error which stopped it loading.
+
+        """
+        return (pool or _get_pool()).apply_async(_load_from,
+                (cls, path, format), callback=callback)
+
+    def save_async(self, path=None, pool=None, callback=None, warnings=None):
+        """Save project to file in the background.
+
+        Takes the same arguments as :attr:`save`, but ``path`` can also be a
+        function, which is called with the contents of the saved file as a
+        string, such as the ``write`` method of a socket or a response.
+
+        Don't change the project until it's saved.
+
+        :param pool:     See :attr:`load_async`.
+        :param callback: Called with the result of ``get()`` once it's saved,
+                         from one of the pool's threads.
+
+        :returns: a :py:class:`multiprocessing.pool.AsyncResult`. Its
+                  ``get()`` method waits for the result of :attr:`save`, or
+                  None if ``path`` is a function.
+
+        """
+        return (pool or _get_pool()).apply_async(_save_to,
+                (self, path, warnings), callback=callback)
+
     def _normalize(self):
         """Convert the project to a standardised form for the current plugin.
 
@@ -428,10 +900,12 @@ class Project(object):
                     raise ValueError, \
                         "Can't have sprite on stage that isn't in sprites"
 
-        # normalize Scriptables
-        self.stage._normalize()
-        for sprite in self.sprites:
-            sprite._normalize()
+        # normalize Scriptables -- skip the scripts of Scriptables which
+        # haven't changed since they were last normalized for this plugin
+        scriptables = [self.stage] + self.sprites
+        dirty = [not s._is_normalized(self._plugin) for s in scriptables]
+        for (scriptable, is_dirty) in zip(scriptables, dirty):
+            scriptable._normalize(scripts=is_dirty)
 
         # normalize actors
         for actor in self.actors:
@@ -490,10 +964,12 @@ class Project(object):
 
             return block
 
-        for scriptable in [self.stage] + self.sprites:
-            for script in scriptable.scripts:
-                if isinstance(script, Script):
-                    script.blocks = map(convert_block, script.blocks)
+        for (scriptable, is_dirty) in zip(scriptables, dirty):
+            if is_dirty:
+                for script in scriptable.scripts:
+                    if isinstance(script, Script):
+                        script.blocks = map(convert_block, script.blocks)
+                scriptable._set_normalized(self._plugin)
 
         # workaround unsupported features
         for feature in kurt.plugin.Feature.FEATURES.values():
@@ -506,22 +982,16 @@ class Project(object):
             feature.normalize(self)
 
     def get_broadcasts(self):
-        def get_broadcasts(block):
-            for (arg, insert) in zip(block.args, block.type.inserts):
-                if isinstance(arg, Block):
-                    for b in get_broadcasts(arg):
-                        yield b
-                elif isinstance(arg, list):
-                    for arg_block in arg:
-                        for b in get_broadcasts(arg_block):
-                            yield b
-                elif insert.kind == "broadcast":
-                    yield arg
+        """Yield the broadcast names used by all scripts in the project.
+
+        Names are cached per-script, so only scripts which have changed since
+        the last call are walked again.
 
+        """
         for scriptable in [self.stage] + self.sprites:
             for script in scriptable.scripts:
-                for block in script.blocks:
-                    for b in get_broadcasts(block):
+                if isinstance(script, Script):
+                    for b in script._get_broadcasts():
                         yield b
 
 
@@ -550,10 +1020,10 @@ class UnsupportedFeature(object):
 #-- Errors --#
 
 class UnknownFormat(Exception):
-    """The file extension is not recognised.
+    """The file extension or contents is not recognised.
 
     Raised when :class:`Project` can't find a valid format plugin to handle the
-    file extension.
+    file.
 
     """
     pass
@@ -629,10 +1099,7 @@ class Scriptable(object):
         """:class:`dict` of :class:`Lists <List>` by name."""
 
         self.costumes = []
-        """List of :class:`Costumes <Costume>`."""
-
         self.sounds = []
-        """List of :class:`Sounds <Sound>`."""
 
         self.costume = None
         """The currently selected :class:`Costume`.
@@ -647,7 +1114,47 @@ class Scriptable(object):
         self.volume = 100
         """The volume in percent used for note and sound blocks."""
 
-    def _normalize(self):
+        self._normalized = None
+        """``(plugin name, signature)`` recorded when :attr:`scripts` were
+        last normalized. See :attr:`_is_normalized`.
+
+        """
+
+    @property
+    def costumes(self):
+        """List of :class:`Costumes <Costume>`."""
+        return self._costumes
+
+    @costumes.setter
+    def costumes(self, value):
+        self._costumes = _indexed(value)
+
+    @property
+    def sounds(self):
+        """List of :class:`Sounds <Sound>`."""
+        return self._sounds
+
+    @sounds.setter
+    def sounds(self, value):
+        self._sounds = _indexed(value)
+
+    def get_costume(self, name):
+        """Get a costume from :attr:`costumes` by name.
+
+        Returns None if the costume isn't found.
+
+        """
+        return self.costumes.get_by_name(name)
+
+    def get_sound(self, name):
+        """Get a sound from :attr:`sounds` by name.
+
+        Returns None if the sound isn't found.
+
+        """
+        return self.sounds.get_by_name(name)
+
+    def _normalize(self, scripts=True):
         # costumes
         if self.costume:
             # Make sure it's in costumes
@@ -662,6 +1169,9 @@ class Scriptable(object):
                 self.costume = Costume("blank", Image.new((1, 1), BLACK))
                 self.costumes = [self.costume]
 
+        if not scripts:
+            return
+
         # scripts
         for script in self.scripts:
             script._normalize()
@@ -672,10 +1182,58 @@ class Scriptable(object):
         have_position.sort(key=lambda s: (s.pos[1], s.pos[0]))
         self.scripts = have_position + no_position
 
+    def _signature(self, compute=True):
+        """Return a tuple describing the current contents of :attr:`scripts`.
+
+        Uses the cached :attr:`Script.digest` and block comments, which are
+        cleared whenever a script's blocks change. If ``compute`` is false,
+        scripts without them cached give ``None`` rather than being hashed.
+
+        """
+        signature = []
+        for script in self.scripts:
+            if isinstance(script, Script):
+                if compute:
+                    (digest, comments) = (script.digest,
+                                          script._get_comments())
+                else:
+                    (digest, comments) = (script._hash, script._comments)
+                if digest is None or comments is None:
+                    return None
+                signature.append((digest, comments, script.pos))
+            else:
+                signature.append((script.__class__, script.text, script.pos))
+        return tuple(signature)
+
+    def _set_normalized(self, plugin):
+        """Record that :attr:`scripts` are normalized for the plugin."""
+        self._normalized = (plugin.name, self._signature())
+
+    def _is_normalized(self, plugin):
+        """Return True if :attr:`scripts` haven't changed since they were
+        last normalized for the plugin.
+
+        Doesn't need to look inside unchanged scripts.
+
+        """
+        if self._normalized and self._normalized[0] == plugin.name:
+            return self._signature(compute=False) == self._normalized[1]
+        return False
+
+    def _adopt_normalized(self, other):
+        """Take the normalized state of ``other``, a normalized copy of this
+        Scriptable, if normalizing it made no changes to the scripts.
+
+        """
+        if (other._normalized and self._normalized is not other._normalized
+                and self._signature() == other._normalized[1]):
+            self._normalized = other._normalized
+
     def copy(self, o=None):
         """Return a new instance, deep-copying all the attributes."""
         if o is None: o = self.__class__(self.project)
         o.scripts = [s.copy() for s in self.scripts]
+        o._normalized = self._normalized
         o.variables = dict((n, v.copy()) for (n, v) in self.variables.items())
         o.lists = dict((n, l.copy()) for (n, l) in self.lists.items())
         o.costumes = [c.copy() for c in self.costumes]
@@ -708,7 +1266,7 @@ class Scriptable(object):
         reference.
 
         """
-        self.scripts.append(kurt.text.parse(text, self))
+        self.scripts.append(kurt.text.Parser(self).parse(text))
 
 
 class Stage(Scriptable):
@@ -751,10 +1309,10 @@ class Stage(Scriptable):
         return "<%s.%s()>" % (self.__class__.__module__,
                 self.__class__.__name__)
 
-    def _normalize(self):
+    def _normalize(self, scripts=True):
         if not self.costume and not self.costumes:
             self.costume = Costume("blank", Image.new(self.SIZE, self.COLOR))
-        Scriptable._normalize(self)
+        Scriptable._normalize(self, scripts)
 
 
 class Sprite(Scriptable, Actor):
@@ -773,11 +1331,7 @@ class Sprite(Scriptable, Actor):
     def __init__(self, project, name):
         Scriptable.__init__(self, project)
 
-        self.name = unicode(name)
-        """The name of the sprite, as referred to from scripts and displayed in
-        the Scratch interface.
-
-        """
+        self.name = name
 
         self.position = (0, 0)
         """The ``(x, y)`` position of the centre of the sprite in Scratch
@@ -818,8 +1372,22 @@ class Sprite(Scriptable, Actor):
 
         """
 
-    def _normalize(self):
-        Scriptable._normalize(self)
+    @property
+    def name(self):
+        """The name of the sprite, as referred to from scripts and displayed in
+        the Scratch interface.
+
+        """
+        return self._name
+
+    @name.setter
+    def name(self, value):
+        if hasattr(self, '_name'):
+            _renamed()
+        self._name = unicode(value)
+
+    def _normalize(self, scripts=True):
+        Scriptable._normalize(self, scripts)
         assert self.rotation_style in ("normal", "leftRight", "none")
 
     def copy(self):
@@ -970,7 +1538,7 @@ class Watcher(Actor):
 
 #-- Variables --#
 
-class Variable(object):
+class Variable(_Slotted):
     """A memory value used in scripts.
 
     There are both :attr:`global variables <Project.variables>` and
@@ -980,6 +1548,8 @@ class Variable(object):
 
     """
 
+    __slots__ = ('value', 'is_cloud', 'watcher')
+
     def __init__(self, value=0, is_cloud=False):
         self.value = value
         """The value of the variable, usually a number or a string.
@@ -1012,7 +1582,7 @@ class Variable(object):
         return r
 
 
-class List(object):
+class List(_Slotted):
     """A sequence of items used in scripts.
 
     Each item takes a :class:`Variable`-like value.
@@ -1021,6 +1591,8 @@ class List(object):
     list values, and this class is not used.
 
     """
+    __slots__ = ('items', 'is_cloud', 'watcher')
+
     def __init__(self, items=None, is_cloud=False):
         self.items = list(items) if items else []
         """The items contained in the list. A Python list of unicode
@@ -1059,7 +1631,7 @@ class List(object):
 
 #-- Color --#
 
-class Color(object):
+class Color(_Slotted):
     """A 24-bit RGB color value.
 
     Accepts tuple or hexcode arguments::
@@ -1075,6 +1647,8 @@ class Color(object):
 
     """
 
+    __slots__ = ('r', 'g', 'b')
+
     def __init__(self, r, g=None, b=None):
         if g is None and b is None:
             if isinstance(r, Color):
@@ -1142,7 +1716,7 @@ class Color(object):
 
 #-- BlockTypes --#
 
-class Insert(object):
+class Insert(_Slotted):
     """The specification for an argument to a :class:`BlockType`."""
 
     SHAPE_DEFAULTS = {
@@ -1207,6 +1781,8 @@ class Insert(object):
         'videoState': ['off', 'on', 'on-flipped'],
     }
 
+    __slots__ = ('shape', 'kind', 'default', 'unevaluated', 'name')
+
     def __init__(self, shape, kind=None, default=None, name=None,
             unevaluated=None):
         self.shape = shape
@@ -1344,22 +1920,38 @@ class Insert(object):
                       self.unevaluated)
 
     def stringify(self, value=None, block_plugin=False):
+        return _stringify(self._write_text, value, block_plugin)
+
+    def _write_text(self, writer, value=None, block_plugin=False):
         if value is None or (value is False and self.shape == "boolean"):
             value = self.default
             if value is None:
                 value = ""
         if isinstance(value, Block): # use block's shape
-            return value.stringify(block_plugin, in_insert=True)
+            value._write_text(writer, block_plugin, in_insert=True)
+        elif self.shape == 'stack':
+            writer.write("\n")
+            indent = writer.indent
+            writer.indent += "    "
+            writer.write("    ")
+            if isinstance(value, list):
+                for (i, block) in enumerate(value):
+                    if i:
+                        writer.write("\n")
+                    block._write_text(writer, block_plugin)
+            else:
+                if hasattr(value, "stringify"):
+                    value = value.stringify()
+                writer.write(value)
+            writer.indent = indent
+            writer.write("\n")
         else:
             if hasattr(value, "stringify"):
                 value = value.stringify()
             elif isinstance(value, list):
                 value = "\n".join(block.stringify(block_plugin) for block in value)
 
-            if self.shape == 'stack':
-                value = value.replace("\n", "\n    ")
-
-            if block_plugin or self.shape in 'stack':
+            if block_plugin:
                 value = Insert.SHAPE_FMTS.get(self.shape, '%s') % (value,)
             elif self.shape == 'string' or self.kind == 'broadcast':
                 value = unicode(value)
@@ -1367,7 +1959,9 @@ class Insert(object):
                     value = '"%s"' % value.replace('"', '\\"')
                 else:
                     value = "'%s'" % value.replace("'", "\\'")
-            return value
+            else:
+                value = "%s" % (value,)
+            writer.write(value)
 
     def options(self, scriptable=None):
         """Return a list of valid options to a menu insert, given a
@@ -1506,22 +2100,32 @@ class BaseBlockType(object):
                 self.shape)
 
     def stringify(self, args=None, block_plugin=False, in_insert=False):
+        return _stringify(self._write_text, args, block_plugin, in_insert)
+
+    def _write_text(self, writer, args=None, block_plugin=False,
+                    in_insert=False):
         if args is None: args = self.defaults
         args = list(args)
 
-        r = self.text % tuple(i.stringify(args.pop(0), block_plugin)
-                              for i in self.inserts)
-        for insert in self.inserts:
-            if insert.shape == 'stack':
-                return r + "end"
-
-        fmt = BaseBlockType.SHAPE_FMTS.get(self.shape, "%s")
-        if not block_plugin:
-            fmt = "%s" if fmt == "%s" else "(%s)"
-        if in_insert and fmt == "%s":
-            fmt = "{%s}"
-
-        return fmt % r
+        if self.has_insert('stack'):
+            fmt = "%s"
+        else:
+            fmt = BaseBlockType.SHAPE_FMTS.get(self.shape, "%s")
+            if not block_plugin:
+                fmt = "%s" if fmt == "%s" else "(%s)"
+            if in_insert and fmt == "%s":
+                fmt = "{%s}"
+        (before, after) = fmt.split("%s")
+
+        writer.write(before)
+        for part in self.parts:
+            if isinstance(part, Insert):
+                part._write_text(writer, args.pop(0), block_plugin)
+            else:
+                writer.write(part)
+        writer.write(after)
+        if self.has_insert('stack'):
+            writer.write("end")
 
     def has_insert(self, shape):
         """Returns True if any of the inserts have the given shape."""
@@ -1546,6 +2150,16 @@ class BlockType(BaseBlockType):
         copy['_workaround'] = None
         return copy
 
+    def __reduce__(self):
+        """Registered block types are pickled by reference, as the format and
+        command of their first conversion, so that they aren't copied for
+        every block."""
+        pbt = self.convert()
+        if kurt.plugin.Kurt.block_by_conversion(pbt.format,
+                                                pbt.command) is self:
+            return (_get_block_type, (pbt.format, pbt.command))
+        return (copy_reg.__newobj__, (self.__class__,), self.__getstate__())
+
     def __init__(self, pbt):
         if isinstance(pbt, basestring):
             raise ValueError("Invalid argument. Did you mean `BlockType.get`?")
@@ -1716,6 +2330,15 @@ class PluginBlockType(BaseBlockType):
         return self.__class__(self.category, self.shape, self.command,
                               self.parts, self._match)
 
+    def __reduce__(self):
+        """Registered conversions are pickled by reference, like
+        :class:`BlockType`."""
+        block_type = kurt.plugin.Kurt.block_by_conversion(self.format,
+                                                          self.command)
+        if block_type and block_type._plugins.get(self.format) is self:
+            return (_get_plugin_block_type, (self.format, self.command))
+        return (copy_reg.__newobj__, (self.__class__,), self.__dict__)
+
     def __eq__(self, other):
         if isinstance(other, BlockType):
             if self.shape == other.shape and self.inserts == other.inserts:
@@ -1755,9 +2378,83 @@ class CustomBlockType(BaseBlockType):
 
 
 
+def _get_block_type(format, command):
+    """Return the registered :class:`BlockType`, when unpickling."""
+    block_type = kurt.plugin.Kurt.block_by_conversion(format, command)
+    if not block_type:
+        raise UnknownBlock, "%s: %r" % (format, command)
+    return block_type
+
+def _get_plugin_block_type(format, command):
+    """Return the registered :class:`PluginBlockType`, when unpickling."""
+    return _get_block_type(format, command).convert(format)
+
+
+
 #-- Scripts --#
 
-class Block(object):
+def _type_digest(block_type):
+    """Return a string identifying the block type, for :attr:`Block.digest`.
+    """
+    if isinstance(block_type, BlockType):
+        return "command:" + block_type.convert().command
+    else: # CustomBlockType
+        return "custom:%s:%s" % (block_type.shape, block_type.text)
+
+def _arg_digest(arg, parent):
+    """Return a string identifying the argument, for :attr:`Block.digest`.
+
+    Equal arguments give the same string.
+
+    """
+    if isinstance(arg, Block):
+        arg._add_parent(parent)
+        return "block:" + arg.digest
+    elif isinstance(arg, list):
+        return "[%s]" % ",".join(_arg_digest(b, parent) for b in arg)
+    elif isinstance(arg, BaseBlockType):
+        return _type_digest(arg)
+    elif isinstance(arg, Color):
+        return "color:" + arg.stringify()
+    elif isinstance(arg, float) and not arg.is_integer():
+        return "number:%r;" % arg
+    elif isinstance(arg, (bool, int, long, float)):
+        return "number:%d;" % arg
+    elif isinstance(arg, basestring):
+        if isinstance(arg, unicode):
+            arg = arg.encode("utf-8")
+        return "string:%d:%s" % (len(arg), arg)
+    else:
+        arg = repr(arg)
+        return "other:%d:%s" % (len(arg), arg)
+
+def _get_broadcasts(block):
+    """Yield the broadcast names used by the block and its arguments."""
+    for (arg, insert) in zip(block.args, block.type.inserts):
+        if isinstance(arg, Block):
+            for b in _get_broadcasts(arg):
+                yield b
+        elif isinstance(arg, list):
+            for arg_block in arg:
+                for b in _get_broadcasts(arg_block):
+                    yield b
+        elif insert.kind == "broadcast":
+            yield arg
+
+def _get_comments(block):
+    """Yield the comments of the block and the blocks in its arguments."""
+    yield block.comment
+    for arg in block.args:
+        if isinstance(arg, Block):
+            for c in _get_comments(arg):
+                yield c
+        elif isinstance(arg, list):
+            for arg_block in arg:
+                for c in _get_comments(arg_block):
+                    yield c
+
+
+class Block(_Slotted):
     """A statement in a graphical programming language. Blocks can connect
     together to form sequences of commands, which are stored in a
     :class:`Script`. Blocks perform different commands depending on their
@@ -1792,37 +2489,134 @@ class Block(object):
 
     """
 
+    __slots__ = ('_type', '_args', '_comment', '_hash', '_parents',
+                 '__weakref__')
+
     def __init__(self, block_type, *args):
+        self._hash = None
+        self._parents = None
+
         self.type = BlockType.get(block_type)
-        """:class:`BlockType` instance. The command this block performs."""
+        self.comment = ""
 
-        self.args = []
-        """List of arguments to the block.
+        block_args = self.type.defaults[:] if self.type else []
+        for i in xrange(len(args)):
+            if i < len(block_args):
+                block_args[i] = args[i]
+            else:
+                block_args.append(args[i])
+        self.args = block_args
 
-        The block's parameters are found in :attr:`type.inserts
-        <BlockType.inserts>`. Default values come from :attr:`type.defaults
-        <BlockType.defaults`.
+        self._normalize()
 
-        """
+    @property
+    def type(self):
+        """:class:`BlockType` instance. The command this block performs."""
+        return self._type
 
-        self.comment = ""
+    @type.setter
+    def type(self, value):
+        self._type = value
+        self._changed()
+
+    @property
+    def comment(self):
         """The text of the comment attached to the block. Empty if no comment
         is attached.
 
         Comments can only be attached to stack blocks.
 
         """
+        return self._comment
 
-        if self.type:
-            self.args = self.type.defaults[:]
+    @comment.setter
+    def comment(self, value):
+        self._comment = value
+        self._changed() # not in the digest, but scripts cache their comments
 
-        for i in xrange(len(args)):
-            if i < len(self.args):
-                self.args[i] = args[i]
-            else:
-                self.args.append(args[i])
+    @property
+    def args(self):
+        """List of arguments to the block.
 
-        self._normalize()
+        The block's parameters are found in :attr:`type.inserts
+        <BlockType.inserts>`. Default values come from :attr:`type.defaults
+        <BlockType.defaults`.
+
+        Assigning a list stores a copy of it, so changes can be tracked for
+        :attr:`digest`. The same goes for lists put into :attr:`args`, such
+        as the stack of blocks inside a C-block.
+
+        """
+        return self._args
+
+    @args.setter
+    def args(self, value):
+        self._args = _ArgList(self, value)
+        self._changed()
+
+    @property
+    def digest(self):
+        """A structural hash of the block, as a hex string.
+
+        Computed Merkle-style from the block's command and the digests of its
+        arguments, so equal blocks have equal digests. The value is cached,
+        and is stable between processes, so it can be used to find identical
+        scripts across projects. :attr:`comment` is not included.
+
+        The cache is cleared when the block or any of the blocks inside it
+        are changed through their attributes or :attr:`args` lists.
+
+        """
+        if self._hash is None:
+            h = hashlib.sha1(_type_digest(self.type))
+            for arg in self._args:
+                h.update(_arg_digest(arg, self))
+            self._hash = h.hexdigest()
+        return self._hash
+
+    def __hash__(self):
+        return int(self.digest[:15], 16)
+
+    def _changed(self):
+        """Clear the cached digest of this block and the blocks containing
+        it."""
+        if self._hash is not None:
+            self._hash = None
+            (parents, self._parents) = (self._parents, None)
+            for ref in (parents or {}).values():
+                parent = ref()
+                if parent is not None:
+                    parent._changed()
+
+    def _add_parent(self, parent):
+        # Weak references, so a block shared by many scripts (see
+        # BlockTable) doesn't keep them all alive.
+        if self._parents is None:
+            self._parents = {}
+        else:
+            count = len(self._parents)
+            if count >= 64 and not count & (count - 1): # a power of two
+                for (key, ref) in self._parents.items():
+                    if ref() is None:
+                        del self._parents[key]
+        self._parents[id(parent)] = weakref.ref(parent)
+
+    def __getstate__(self):
+        return {
+            'type': self.type,
+            'args': [list(arg) if isinstance(arg, list) else arg
+                     for arg in self.args],
+            'comment': self.comment,
+        }
+
+    def __setstate__(self, state):
+        self._hash = None
+        self._parents = None
+        _Slotted.__setstate__(self, state)
+
+    def __reduce__(self):
+        state = self.__getstate__()
+        return (_new_block, (state['type'], state['args'], state['comment']))
 
     def _normalize(self):
         self.type = BlockType.get(self.type)
@@ -1850,7 +2644,14 @@ class Block(object):
             elif isinstance(arg, list):
                 arg = [b.copy() for b in arg]
             args.append(arg)
-        return Block(self.type, *args)
+        block = Block(self.type, *args)
+        if self._hash is not None: # the copies have digests cached, too
+            block._hash = self._hash
+            for arg in block.args:
+                for child in (arg if isinstance(arg, list) else [arg]):
+                    if isinstance(child, Block):
+                        child._add_parent(block)
+        return block
 
     def __eq__(self, other):
         return (
@@ -1888,16 +2689,26 @@ class Block(object):
         return string + ")"
 
     def stringify(self, block_plugin=False, in_insert=False):
-        s = self.type.stringify(self.args, block_plugin, in_insert)
-        if self.comment:
-            i = s.index("\n") if "\n" in s else len(s)
-            indent = "\n"  +  " " * i  +  " // "
-            comment = " // " + self.comment.replace("\n", indent)
-            s = s[:i] + comment + s[i:]
-        return s
+        return _stringify(self._write_text, block_plugin, in_insert)
+
+    def _write_text(self, writer, block_plugin=False, in_insert=False):
+        if self.comment: # goes at the end of the first line
+            writer.comments.append((writer.column, self.comment))
+            waiting = len(writer.comments)
+        self.type._write_text(writer, self.args, block_plugin, in_insert)
+        if self.comment and len(writer.comments) == waiting:
+            writer.write_comment(*writer.comments.pop())
+
 
+def _new_block(block_type, args, comment):
+    """Return a new :class:`Block` with exactly these attributes, without
+    normalizing it, when unpickling."""
+    block = Block.__new__(Block)
+    block.__setstate__({'type': block_type, 'args': args, 'comment': comment})
+    return block
 
-class Script(object):
+
+class Script(_Slotted):
     """A single sequence of blocks. Each :class:`Scriptable` can have many
     Scripts.
 
@@ -1909,10 +2720,15 @@ class Script(object):
 
     """
 
+    __slots__ = ('_blocks', 'pos', '_hash', '_broadcasts', '_comments',
+                 '__weakref__')
+
     def __init__(self, blocks=None, pos=None):
+        self._hash = None
+        self._broadcasts = None
+        self._comments = None
+
         self.blocks = blocks or []
-        self.blocks = list(self.blocks)
-        """The list of :class:`Blocks <Block>`."""
 
         self.pos = tuple(pos) if pos else None
         """``(x, y)`` position from the top-left of the script area in
@@ -1920,6 +2736,71 @@ class Script(object):
 
         """
 
+    @property
+    def blocks(self):
+        """The list of :class:`Blocks <Block>`."""
+        return self._blocks
+
+    @blocks.setter
+    def blocks(self, value):
+        self._blocks = _TrackedList(self, value)
+        self._changed()
+
+    @property
+    def digest(self):
+        """A structural hash of the script's blocks, as a hex string.
+
+        See :attr:`Block.digest`. :attr:`pos` is not included.
+
+        """
+        if self._hash is None:
+            h = hashlib.sha1("script")
+            for block in self._blocks:
+                h.update(_arg_digest(block, self))
+            self._hash = h.hexdigest()
+        return self._hash
+
+    def __hash__(self):
+        return int(self.digest[:15], 16)
+
+    def _changed(self):
+        self._hash = None
+        self._broadcasts = None
+        self._comments = None
+
+    def _get_broadcasts(self):
+        """Return a tuple of the broadcast names used by the script.
+
+        The result is cached until the script or any of its blocks change.
+
+        """
+        if self._broadcasts is None or self._hash is None:
+            self.digest # register as parent, so changes clear the cache
+            self._broadcasts = tuple(b for block in self._blocks
+                                       for b in _get_broadcasts(block))
+        return self._broadcasts
+
+    def _get_comments(self):
+        """Return a tuple of the comments of all the script's blocks.
+
+        The result is cached until the script or any of its blocks change.
+
+        """
+        if self._comments is None or self._hash is None:
+            self.digest # register as parent, so changes clear the cache
+            self._comments = tuple(c for block in self._blocks
+                                     for c in _get_comments(block))
+        return self._comments
+
+    def __getstate__(self):
+        return {'blocks': list(self.blocks), 'pos': self.pos}
+
+    def __setstate__(self, state):
+        self._hash = None
+        self._broadcasts = None
+        self._comments = None
+        _Slotted.__setstate__(self, state)
+
     def _normalize(self):
         self.pos = self.pos
         self.blocks = list(self.blocks)
@@ -1928,8 +2809,15 @@ class Script(object):
 
     def copy(self):
         """Return a new instance with the same attributes."""
-        return self.__class__([b.copy() for b in self.blocks],
+        script = self.__class__([b.copy() for b in self.blocks],
                 tuple(self.pos) if self.pos else None)
+        if self._hash is not None: # the copies have digests cached, too
+            script._hash = self._hash
+            script._broadcasts = self._broadcasts
+            script._comments = self._comments
+            for block in script.blocks:
+                block._add_parent(script)
+        return script
 
     def __eq__(self, other):
         return (
@@ -1951,14 +2839,24 @@ class Script(object):
         return r + ")"
 
     def stringify(self, block_plugin=False):
-        return "\n".join(block.stringify(block_plugin)
-                         for block in self.blocks)
+        return _stringify(self._write_text, block_plugin)
+
+    def dump_text(self, fp, block_plugin=False):
+        """Write the text of :meth:`stringify` to the file-like object fp."""
+        self._write_text(_TextWriter(fp.write), block_plugin)
+
+    def _write_text(self, writer, block_plugin=False):
+        for (i, block) in enumerate(self.blocks):
+            if i:
+                writer.write("\n")
+            block._write_text(writer, block_plugin)
 
     # Pretend to be a list
 
     def __getattr__(self, name):
-        if name.startswith('__') and name.endswith('__'):
-            return super(Script, self).__getattr__(name)
+        if name.startswith('_') or name == 'blocks':
+            # special methods, or slots not set yet, eg. while unpickling
+            raise AttributeError(name)
         return getattr(self.blocks, name)
 
     def __iter__(self):
@@ -1977,9 +2875,11 @@ class Script(object):
         del self.blocks[index]
 
 
-class Comment(object):
+class Comment(_Slotted):
     """A free-floating comment in :attr:`Scriptable.scripts`."""
 
+    __slots__ = ('text', 'pos', '_anchor')
+
     def __init__(self, text, pos=None):
         self.text = unicode(text)
         """The text of the comment."""
@@ -2008,6 +2908,50 @@ class Comment(object):
         self.text = unicode(self.text)
 
 
+class BlockTable(object):
+    """An interning table for :class:`Blocks <Block>`.
+
+    Replaces structurally identical blocks with a single shared instance, so
+    repeated subtrees take up memory only once. Use the same table for many
+    scripts, sprites or projects::
+
+        table = kurt.BlockTable()
+        for scriptable in [p.stage] + p.sprites:
+            for script in scriptable.scripts:
+                table.intern(script)
+
+    Blocks are identical if they are equal and have the same
+    :attr:`Block.comment`. Since the instances are shared, don't modify
+    interned blocks in-place -- copy them first.
+
+    """
+
+    def __init__(self):
+        self._blocks = {}
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def intern(self, thing):
+        """Return the shared instance for a :class:`Block`.
+
+        The arguments of the block are interned recursively. Scripts and
+        lists of blocks are interned in-place, and are returned. Other values
+        are returned unchanged.
+
+        """
+        if isinstance(thing, Script):
+            self.intern(thing.blocks)
+        elif isinstance(thing, list):
+            thing[:] = [self.intern(block) for block in thing]
+        elif isinstance(thing, Block):
+            args = [self.intern(arg) for arg in thing.args]
+            if any(a is not b for (a, b) in zip(args, thing.args)):
+                thing.args = args
+            thing = self._blocks.setdefault((thing, thing.comment), thing)
+        return thing
+
+
 
 #-- Costumes --#
 
@@ -2019,8 +2963,7 @@ class Costume(object):
     """
 
     def __init__(self, name, image, rotation_center=None):
-        self.name = unicode(name)
-        """Name used by scripts to refer to this Costume."""
+        self.name = name
 
         if not rotation_center:
             rotation_center = (int(image.width / 2), int(image.height / 2))
@@ -2035,6 +2978,17 @@ class Costume(object):
         self.image = image
         """An :class:`Image` instance containing the raw image data."""
 
+    @property
+    def name(self):
+        """Name used by scripts to refer to this Costume."""
+        return self._name
+
+    @name.setter
+    def name(self, value):
+        if hasattr(self, '_name'):
+            _renamed()
+        self._name = unicode(value)
+
     def copy(self):
         """Return a new instance with the same attributes."""
         return Costume(self.name, self.image, self.rotation_center)
@@ -2334,11 +3288,21 @@ class Sound(object):
 
     def __init__(self, name, waveform):
         self.name = name
-        """Name used by scripts to refer to this Sound."""
 
         self.waveform = waveform
         """A :class:`Waveform` instance containing the raw sound data."""
 
+    @property
+    def name(self):
+        """Name used by scripts to refer to this Sound."""
+        return self._name
+
+    @name.setter
+    def name(self, value):
+        if hasattr(self, '_name'):
+            _renamed()
+        self._name = value
+
     def copy(self):
         """Return a new instance with the same attributes."""
         return Sound(self.name, self.waveform)
@@ -2478,6 +3442,12 @@ class Waveform(object):
 
 import kurt.plugin
 import kurt.text
+import kurt.layout
+import kurt.batch
+import kurt.cache
+import kurt.snapshot
 
 import kurt.scratch20
 import kurt.scratch14
+
+import kurt.corpus
@@ -0,0 +1,295 @@
+# Copyright (C) 2012 Tim Radvan
+#
+# This file is part of Kurt.
+#
+# Kurt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Kurt is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with Kurt. If not, see <http://www.gnu.org/licenses/>.
+
+"""Converting whole folders of projects to another format.
+
+Each file is converted in its own process, so a file which takes too long or
+uses too much memory can be killed without losing the rest. Finished files are
+written to a :class:`Manifest`, so an interrupted conversion can be run again
+and will carry on where it left off::
+
+    kurt.batch.convert("projects/", "converted/", "scratch20",
+                       manifest="converted/manifest.jsonl", timeout=60)
+
+"""
+
+import os
+import json
+import time
+import multiprocessing
+from collections import deque
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import kurt
+
+
+
+class Manifest(object):
+    """A record of the files a conversion has finished with.
+
+    Stored as one JSON object per line, which is written as soon as each file
+    is done. Each record is a dict with the keys:
+
+    * ``source``: the path of the original file
+    * ``output``: the path of the converted file, or None if it failed
+    * ``status``: ``"ok"`` or ``"failed"``
+    * ``error``: why the file failed, or None
+    * ``warnings``: a list of the :class:`UnsupportedFeature` messages from
+      the conversion, as strings
+    * ``seconds``: how long the file took
+
+    :param path: Path to the manifest file. It's created if it doesn't exist.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        self.records = {}
+        """Dict of source paths to their latest record."""
+
+        if os.path.exists(path):
+            for line in open(path, "rb"):
+                try:
+                    record = json.loads(line)
+                except ValueError: # half-written when interrupted
+                    continue
+                self.records[record['source']] = record
+
+        self._fp = None
+
+    def __contains__(self, source):
+        return source in self.records
+
+    def failed(self):
+        """Return the source paths of the files which failed."""
+        return [s for (s, r) in self.records.items() if r['status'] != "ok"]
+
+    def record(self, record):
+        """Add a record, and write it to the file straight away."""
+        if self._fp is None:
+            self._fp = open(self.path, "ab+")
+            self._fp.seek(0, os.SEEK_END)
+            if self._fp.tell():
+                self._fp.seek(-1, os.SEEK_END)
+                if self._fp.read(1) != "\n":
+                    self._fp.write("\n")
+        self._fp.write(json.dumps(record) + "\n")
+        self._fp.flush()
+        self.records[record['source']] = record
+
+    def close(self):
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+
+
+def find_projects(folder):
+    """Yield the paths of the files in the folder, and its subfolders, which
+    have the extension of one of the format plugins."""
+    extensions = set(p.extension for p in kurt.plugin.Kurt.plugins.values())
+    for (root, dirs, files) in os.walk(folder):
+        dirs.sort()
+        for filename in sorted(files):
+            if os.path.splitext(filename)[1].lower() in extensions:
+                yield os.path.join(root, filename)
+
+
+def convert(source, dest, format, **kwargs):
+    """Convert every project in the ``source`` folder to ``format``.
+
+    The converted files are saved in the ``dest`` folder, with the same
+    subfolders as ``source``. Takes the same keyword arguments as
+    :func:`run`.
+
+    :returns: a list of records for the files converted in this run. See
+              :class:`Manifest`.
+
+    """
+    plugin = kurt.plugin.Kurt.get_plugin(format)
+    jobs = []
+    for path in find_projects(source):
+        relpath = os.path.relpath(path, source)
+        output = os.path.join(dest, os.path.splitext(relpath)[0])
+        jobs.append((path, output + plugin.extension))
+    return run(jobs, **kwargs)
+
+
+def run(jobs, workers=None, timeout=None, memory_limit=None, manifest=None,
+        retry_failed=False, callback=None, cache=None):
+    """Convert a list of ``(source, output)`` paths.
+
+    The format to convert to is taken from the extension of the output path.
+    Folders for the output files are created as needed.
+
+    :param workers:      How many files to convert at once. Defaults to the
+                         number of CPUs.
+    :param timeout:      Seconds after which to give up on a file.
+    :param memory_limit: Bytes of address space each conversion may use. Not
+                         available on Windows.
+    :param manifest:     A :class:`Manifest` or path to one. Files which are
+                         already in it are skipped.
+    :param retry_failed: Don't skip files which failed last time.
+    :param callback:     Called with each record as soon as it's finished.
+    :param cache:        A :class:`kurt.cache.ConversionCache` or path to one,
+                         so that files which have been converted before are
+                         copied from the cache.
+
+    :returns: a list of records for the files converted in this run. See
+              :class:`Manifest`.
+
+    """
+    if memory_limit and resource is None:
+        raise ValueError, "memory_limit isn't supported on this platform"
+
+    if isinstance(cache, basestring):
+        cache = kurt.cache.ConversionCache(cache)
+
+    if isinstance(manifest, basestring):
+        manifest = Manifest(manifest)
+        close_manifest = True
+    else:
+        close_manifest = False
+
+    if manifest is not None:
+        jobs = [(s, o) for (s, o) in jobs if s not in manifest or
+                (retry_failed and manifest.records[s]['status'] != "ok")]
+
+    workers = workers or multiprocessing.cpu_count()
+    pending = deque(jobs)
+    running = []
+    records = []
+    try:
+        while pending or running:
+            while pending and len(running) < workers:
+                (source, output) = pending.popleft()
+                running.append(_Job(source, output, memory_limit, cache))
+
+            finished = [job for job in running if job.poll(timeout)]
+            for job in finished:
+                running.remove(job)
+                record = job.record()
+                if manifest is not None:
+                    manifest.record(record)
+                records.append(record)
+                if callback:
+                    callback(record)
+
+            if not finished:
+                time.sleep(0.01)
+    finally:
+        for job in running:
+            job.kill()
+        if close_manifest:
+            manifest.close()
+
+    return records
+
+
+
+class _Job(object):
+    """A file being converted in a child process."""
+
+    def __init__(self, source, output, memory_limit, cache):
+        self.source = source
+        self.output = output
+        self.error = None
+        self.warnings = []
+
+        folder = os.path.dirname(output)
+        if folder and not os.path.isdir(folder):
+            try:
+                os.makedirs(folder)
+            except OSError: # made by another job
+                if not os.path.isdir(folder):
+                    raise
+
+        (self._conn, child_conn) = multiprocessing.Pipe(duplex=False)
+        self._process = multiprocessing.Process(target=_convert,
+                args=(source, output, memory_limit, cache, child_conn))
+        self.started = time.time()
+        self._process.start()
+        child_conn.close()
+
+    def poll(self, timeout):
+        """Return True if the job has finished."""
+        is_alive = self._process.is_alive()
+        if self._conn.poll():
+            try:
+                (self.error, self.warnings) = self._conn.recv()
+            except EOFError:
+                self.error = "Conversion exited with code %s" % (
+                        self._process.exitcode,)
+        elif not is_alive:
+            self.error = "Conversion exited with code %s" % (
+                    self._process.exitcode,)
+        elif timeout and time.time() - self.started > timeout:
+            self.error = "Timed out after %s seconds" % timeout
+            self._process.terminate()
+        else:
+            return False
+        self._process.join()
+        self._conn.close()
+        return True
+
+    def kill(self):
+        self._process.terminate()
+        self._process.join()
+        self._conn.close()
+        self._remove_output()
+
+    def record(self):
+        if self.error:
+            self._remove_output()
+        return {
+            'source': self.source,
+            'output': None if self.error else self.output,
+            'status': "failed" if self.error else "ok",
+            'error': self.error,
+            'warnings': self.warnings,
+            'seconds': round(time.time() - self.started, 3),
+        }
+
+    def _remove_output(self):
+        if os.path.exists(self.output):
+            os.remove(self.output)
+
+
+def _convert(source, output, memory_limit, cache, conn):
+    """Convert one file. Runs in the child process."""
+    if memory_limit:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+    try:
+        if cache is not None:
+            warnings = cache.convert_file(source, output)
+        else:
+            warnings = []
+            project = kurt.Project.load(source)
+            project.save(output, warnings=warnings)
+            warnings = [unicode(w) for w in warnings]
+        result = (None, warnings)
+    except MemoryError:
+        result = ("Out of memory", [])
+    except Exception, err:
+        result = ("%s: %s" % (err.__class__.__name__, err), [])
+    conn.send(result)
+    conn.close()
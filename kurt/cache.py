@@ -0,0 +1,227 @@
+# Copyright (C) 2012 Tim Radvan
+#
+# This file is part of Kurt.
+#
+# Kurt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Kurt is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with Kurt. If not, see <http://www.gnu.org/licenses/>.
+
+"""A cache of converted projects on local disk, so converting the same file
+again doesn't need to load it::
+
+    cache = kurt.cache.ConversionCache("/var/cache/kurt")
+    (output, warnings) = cache.convert(data, "scratch20", "scratch14")
+
+Entries are keyed by the digest of the input file, the format it's converted
+to, and the version of Kurt. When the cache grows past its size limit, the
+least recently used entries are removed, until it's down to nine tenths of
+the limit.
+
+The cache keeps a running total of its size in a ``sizes`` file, which each
+process adds to, so the folder itself is only measured when that total goes
+over the limit.
+
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+
+import kurt
+
+
+
+class ConversionCache(object):
+    """A folder of converted files, keyed by the contents of the original.
+
+    The cache can be shared between processes.
+
+    :param folder:   Where to keep the cache. Created if it doesn't exist.
+    :param max_size: Size limit of the cache in bytes.
+
+    """
+
+    def __init__(self, folder, max_size=1024 ** 3):
+        self.folder = folder
+        self.max_size = max_size
+
+        self.hits = 0
+        self.misses = 0
+
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        if not os.path.exists(self._sizes_path):
+            self.evict(max_size)
+
+    def key(self, data, format, source_format):
+        """Return the cache key for converting the file contents ``data``
+        from ``source_format`` to ``format``."""
+        h = hashlib.sha1(data)
+        h.update("\0%s\0%s\0%s" % (source_format, format, kurt.__version__))
+        return h.hexdigest()
+
+    def convert(self, data, format, source_format):
+        """Convert the file contents ``data`` to ``format``, or return the
+        cached result.
+
+        :returns: ``(output, warnings)``, where ``output`` is the contents of
+                  the converted file, and ``warnings`` is a list of the
+                  :class:`UnsupportedFeature` messages from the conversion,
+                  as strings.
+
+        """
+        key = self.key(data, format, source_format)
+        result = self.get(key)
+        if result is None:
+            self.misses += 1
+            warnings = []
+            project = kurt.Project.from_bytes(data, source_format)
+            output = project.to_bytes(format, warnings)
+            result = (output, [unicode(w) for w in warnings])
+            self.put(key, *result)
+        else:
+            self.hits += 1
+        return result
+
+    def convert_file(self, source, output):
+        """Convert the file at the path ``source`` and save it to ``output``.
+        The source format is recognised from its contents, or else its
+        extension. The output format is taken from its extension.
+
+        :returns: the list of warnings. See :meth:`convert`.
+
+        """
+        fp = open(source, "rb")
+        data = fp.read()
+        fp.close()
+        plugin = kurt.plugin.Kurt.sniff(data[:kurt.plugin.SNIFF_SIZE])
+        source_format = plugin.name if plugin else _format_for(source)
+        (contents, warnings) = self.convert(data, _format_for(output),
+                                            source_format)
+        fp = open(output, "wb")
+        fp.write(contents)
+        fp.close()
+        return warnings
+
+    def get(self, key):
+        """Return ``(output, warnings)`` for the key, or None."""
+        (output_path, warnings_path) = self._paths(key)
+        try:
+            fp = open(warnings_path, "rb")
+            warnings = json.load(fp)
+            fp.close()
+            fp = open(output_path, "rb")
+            output = fp.read()
+            fp.close()
+        except (EnvironmentError, ValueError):
+            return None
+        try:
+            os.utime(output_path, None) # mark as recently used
+        except OSError:
+            pass
+        return (output, warnings)
+
+    def put(self, key, output, warnings):
+        """Store ``(output, warnings)`` for the key, and make room for it."""
+        (output_path, warnings_path) = self._paths(key)
+        folder = os.path.dirname(output_path)
+        if not os.path.isdir(folder):
+            try:
+                os.makedirs(folder)
+            except OSError: # made by another process
+                pass
+
+        # write to temporary files first, so readers never see half a file
+        self._write(warnings_path, json.dumps(warnings))
+        self._write(output_path, output)
+
+        # other processes add to the same total, so it's read back each time
+        fp = open(self._sizes_path, "a")
+        fp.write("%d\n" % (len(output) + os.path.getsize(warnings_path)))
+        fp.close()
+        if self._total() > self.max_size:
+            self.evict(self.max_size * 9 // 10)
+
+    def evict(self, max_size=None):
+        """Remove the least recently used entries until the cache is no
+        bigger than ``max_size``, which defaults to :attr:`max_size`.
+
+        The size of the cache is measured again from the files in it.
+
+        """
+        if max_size is None:
+            max_size = self.max_size
+        entries = sorted(self._entries())
+        total = sum(size for (mtime, size, paths) in entries)
+        for (mtime, size, paths) in entries:
+            if total <= max_size:
+                break
+            for path in paths:
+                try:
+                    os.remove(path)
+                except OSError: # removed by another process
+                    pass
+            total -= size
+        self._write(self._sizes_path, "%d\n" % total)
+
+    def clear(self):
+        """Remove every entry."""
+        self.evict(0)
+
+    @property
+    def _sizes_path(self):
+        return os.path.join(self.folder, "sizes")
+
+    def _total(self):
+        """Return the size of the cache from the ``sizes`` file."""
+        try:
+            fp = open(self._sizes_path)
+            total = sum(int(line) for line in fp)
+            fp.close()
+        except (EnvironmentError, ValueError): # such as half a line
+            return float("inf")
+        return total
+
+    def _paths(self, key):
+        path = os.path.join(self.folder, key[:2], key)
+        return (path + ".out", path + ".json")
+
+    def _write(self, path, data):
+        (handle, temp_path) = tempfile.mkstemp(dir=os.path.dirname(path))
+        fp = os.fdopen(handle, "wb")
+        fp.write(data)
+        fp.close()
+        os.rename(temp_path, path)
+
+    def _entries(self):
+        """Yield ``(mtime, size, paths)`` for each entry. The size includes
+        the warnings file."""
+        for name in os.listdir(self.folder):
+            folder = os.path.join(self.folder, name)
+            if not os.path.isdir(folder):
+                continue
+            for filename in os.listdir(folder):
+                if filename.endswith(".out"):
+                    path = os.path.join(folder, filename)
+                    warnings_path = path[:-len(".out")] + ".json"
+                    try:
+                        stat = os.stat(path)
+                        size = stat.st_size + os.path.getsize(warnings_path)
+                    except OSError:
+                        continue
+                    yield (stat.st_mtime, size, (path, warnings_path))
+
+
+def _format_for(path):
+    extension = os.path.splitext(path)[1]
+    return kurt.plugin.Kurt.get_plugin(extension=extension).name
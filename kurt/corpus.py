@@ -0,0 +1,187 @@
+# Copyright (C) 2012 Tim Radvan
+#
+# This file is part of Kurt.
+#
+# Kurt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Kurt is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with Kurt. If not, see <http://www.gnu.org/licenses/>.
+
+"""Summarising large numbers of projects.
+
+:func:`scan` loads projects in a pool of processes, and yields a small summary
+of each one as soon as it's done::
+
+    for summary in kurt.corpus.scan(kurt.batch.find_projects("dump/")):
+        print summary['path'], summary['blocks'].get('doForever', 0)
+
+Only one project per process is in progress at once, so memory use doesn't
+grow with the number of projects. A project which takes too long, or whose
+process dies, gets a summary with an ``error``.
+
+"""
+
+import time
+import multiprocessing
+import Queue
+from collections import Counter
+from itertools import chain, count, islice
+
+import kurt
+from kurt.scratch20 import get_blocks_by_id
+
+
+
+PARTS = ("format", "sprites", "scripts", "blocks", "media")
+"""The parts of a summary which :func:`scan` can work out."""
+
+
+def scan(paths, parts=PARTS, workers=None, timeout=600):
+    """Yield a summary of each project in ``paths``, in the order they finish.
+
+    Each summary is a dict with the ``path`` of the project, an ``error``
+    message if it couldn't be loaded, and a key for each of the requested
+    ``parts``:
+
+    * ``format``: the :attr:`name <KurtPlugin.name>` of the format plugin
+    * ``sprites``: the number of sprites
+    * ``scripts``: the number of scripts, not counting comments
+    * ``blocks``: dict of the number of blocks with each command. Commands are
+      those of ``block.type.convert()``, whatever the format of the project,
+      so that counts can be compared. Custom blocks are counted as
+      ``"custom:<text>"``.
+    * ``media``: dict with the number of ``costumes`` and ``sounds``, the
+      total ``image_pixels`` of the bitmap costumes, and the total
+      ``sound_bytes`` of the sound files.
+
+    :param paths:   An iterable of project paths. It's only read as fast as
+                    projects are summarised, so it can be a generator such as
+                    :func:`kurt.batch.find_projects`.
+    :param parts:   The parts of the summary to work out. See :data:`PARTS`.
+    :param workers: How many processes to use. Defaults to the number of CPUs.
+                    If ``0``, projects are loaded in this process.
+    :param timeout: Seconds after which to give up on a project. This is also
+                    how long it takes to notice that a process has died.
+                    ``None`` waits as long as it takes. Ignored if ``workers``
+                    is ``0``.
+
+    """
+    parts = tuple(parts)
+    for part in parts:
+        if part not in PARTS:
+            raise ValueError, "Unknown part %r" % part
+
+    paths = iter(paths)
+    if workers == 0:
+        for path in paths:
+            yield summarize(path, parts)
+        return
+
+    workers = workers or multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(workers)
+    results = Queue.Queue()
+    running = {} # number -> (path, started)
+    numbers = count()
+
+    def fill(paths):
+        # no more than one each, so a project starts as soon as it's sent
+        for path in islice(paths, workers - len(running)):
+            number = next(numbers)
+            running[number] = (path, time.time())
+            pool.apply_async(_summarize_numbered, (number, path, parts),
+                             callback=results.put)
+
+    try:
+        fill(paths)
+        while running:
+            # block in short steps, so KeyboardInterrupt gets through
+            try:
+                (number, summary) = results.get(timeout=0.1)
+            except Queue.Empty:
+                if timeout is None:
+                    continue
+                # a task lost with a dead process never calls back
+                now = time.time()
+                late = [n for (n, (path, started)) in running.items()
+                        if now - started > timeout]
+                if not late:
+                    continue
+                summaries = [{'path': running.pop(n)[0], 'error':
+                              "Timed out after %s seconds" % timeout}
+                             for n in late]
+
+                # the processes may be stuck, so start the rest again
+                pool.terminate()
+                pool = multiprocessing.Pool(workers)
+                restart = [path for (path, started) in running.values()]
+                running.clear()
+                fill(chain(restart, paths))
+                for summary in summaries:
+                    yield summary
+                continue
+
+            if running.pop(number, None) is None:
+                continue # from before a restart
+            fill(paths)
+            yield summary
+    finally:
+        pool.terminate()
+
+
+def _summarize_numbered(number, path, parts):
+    return (number, summarize(path, parts))
+
+def summarize(path, parts=PARTS):
+    """Return the summary of a single project. See :func:`scan`."""
+    summary = {'path': path, 'error': None}
+    try:
+        _summarize(summary, kurt.Project.load(path), parts)
+    except Exception, err:
+        summary['error'] = "%s: %s" % (err.__class__.__name__, err)
+    return summary
+
+def _summarize(summary, project, parts):
+    scriptables = [project.stage] + project.sprites
+    if "format" in parts:
+        summary['format'] = project.format
+    if "sprites" in parts:
+        summary['sprites'] = len(project.sprites)
+    if "scripts" in parts:
+        summary['scripts'] = sum(isinstance(script, kurt.Script)
+                                 for s in scriptables for script in s.scripts)
+    if "blocks" in parts:
+        summary['blocks'] = dict(count_blocks(scriptables))
+    if "media" in parts:
+        images = [c.image for x in scriptables for c in x.costumes]
+        sounds = [s.waveform for x in scriptables for s in x.sounds]
+        summary['media'] = {
+            'costumes': len(images),
+            'image_pixels': sum(i.width * i.height for i in images
+                                if i.format != "SVG"),
+            'sounds': len(sounds),
+            'sound_bytes': sum(len(w.contents) for w in sounds),
+        }
+
+def count_blocks(scriptables):
+    """Return a :class:`Counter` of the blocks in the scriptables' scripts,
+    by command. See :func:`scan`."""
+    blocks = Counter()
+    for scriptable in scriptables:
+        for script in scriptable.scripts:
+            for block in get_blocks_by_id(script):
+                blocks[_command(block.type)] += 1
+    return blocks
+
+def _command(block_type):
+    if isinstance(block_type, kurt.BlockType):
+        return block_type.convert().command
+    else:
+        return "custom:" + block_type.text
@@ -0,0 +1,327 @@
+# Copyright (C) 2012 Tim Radvan
+#
+# This file is part of Kurt.
+#
+# Kurt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Kurt is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with Kurt. If not, see <http://www.gnu.org/licenses/>.
+
+"""An index of many projects in an SQLite database, for answering questions
+about them without loading them again::
+
+    import kurt.index
+    index = kurt.index.Index("projects.db")
+    index.update(kurt.batch.find_projects("dump/"))
+    index.projects_using("doForeverIf")
+    index.projects_with_broadcast("game over")
+
+Updating is incremental: files whose modification time hasn't changed are
+skipped, and files whose contents haven't changed aren't loaded again.
+
+This module isn't imported by ``import kurt``, since it needs :mod:`sqlite3`.
+
+"""
+
+import os
+import sys
+import hashlib
+import sqlite3
+import multiprocessing
+
+import kurt
+from kurt.corpus import count_blocks
+
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime REAL,
+    hash TEXT,
+    format TEXT,
+    name TEXT,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS scriptables (
+    project_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    is_stage INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scripts (
+    project_id INTEGER NOT NULL,
+    scriptable TEXT NOT NULL,
+    digest TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS blocks (
+    project_id INTEGER NOT NULL,
+    scriptable TEXT NOT NULL,
+    command TEXT NOT NULL,
+    count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS broadcasts (
+    project_id INTEGER NOT NULL,
+    name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS variables (
+    project_id INTEGER NOT NULL,
+    scriptable TEXT,
+    name TEXT NOT NULL,
+    is_list INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS media (
+    project_id INTEGER NOT NULL,
+    scriptable TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    digest TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS scriptables_project ON scriptables (project_id);
+CREATE INDEX IF NOT EXISTS scripts_project ON scripts (project_id);
+CREATE INDEX IF NOT EXISTS scripts_digest ON scripts (digest);
+CREATE INDEX IF NOT EXISTS blocks_project ON blocks (project_id);
+CREATE INDEX IF NOT EXISTS blocks_command ON blocks (command);
+CREATE INDEX IF NOT EXISTS broadcasts_project ON broadcasts (project_id);
+CREATE INDEX IF NOT EXISTS broadcasts_name ON broadcasts (name);
+CREATE INDEX IF NOT EXISTS variables_project ON variables (project_id);
+CREATE INDEX IF NOT EXISTS variables_name ON variables (name);
+CREATE INDEX IF NOT EXISTS media_project ON media (project_id);
+CREATE INDEX IF NOT EXISTS media_digest ON media (digest);
+"""
+
+TABLES = ("scriptables", "scripts", "blocks", "broadcasts", "variables",
+          "media")
+"""The tables with rows for each project, besides ``projects``."""
+
+
+class Index(object):
+    """An SQLite database of the contents of many projects.
+
+    The ``projects`` table has a row for each file, with its ``path``,
+    ``format``, and the ``error`` if it couldn't be loaded. The other tables
+    have a ``project_id`` column referring to it:
+
+    * ``scriptables``: the ``name`` of the stage and each sprite
+    * ``scripts``: the :attr:`Script.digest` of each script
+    * ``blocks``: the ``count`` of blocks with each ``command``, for each
+      scriptable. Commands are as for :func:`kurt.corpus.scan`.
+    * ``broadcasts``: the broadcast names from :attr:`Project.get_broadcasts`
+    * ``variables``: each variable and list. ``scriptable`` is None for global
+      ones.
+    * ``media``: the SHA-1 ``digest`` of each costume and sound
+
+    Use :meth:`query` for anything the other methods don't cover.
+
+    :param path: Path to the database file. It's created if it doesn't exist.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def update(self, paths, workers=None):
+        """Add new and changed projects to the index.
+
+        Files with the same modification time as last time are skipped without
+        reading them. Otherwise the file is hashed, and only loaded again if
+        its contents have changed.
+
+        :param paths:   Project paths to index.
+        :param workers: If given, load projects in this many processes at once.
+
+        :returns: the number of projects which were loaded.
+
+        """
+        known = dict((path, (project_id, mtime, hash)) for
+                     (project_id, path, mtime, hash) in
+                     self.db.execute("SELECT id, path, mtime, hash "
+                                     "FROM projects"))
+        tasks = []
+        for path in paths:
+            path = _unicode_path(path)
+            (project_id, mtime, hash) = known.get(path, (None, None, None))
+            if os.path.getmtime(path) != mtime:
+                tasks.append((path, hash))
+
+        if workers and len(tasks) > 1:
+            pool = multiprocessing.Pool(workers)
+            try:
+                return self._store(pool.imap_unordered(_extract, tasks), known)
+            finally:
+                pool.terminate()
+        else:
+            return self._store((_extract(task) for task in tasks), known)
+
+    def prune(self):
+        """Remove projects whose files no longer exist."""
+        with self.db:
+            for (project_id, path) in list(self.db.execute(
+                    "SELECT id, path FROM projects")):
+                if not os.path.exists(path):
+                    self._delete(project_id)
+                    self.db.execute("DELETE FROM projects WHERE id = ?",
+                                    (project_id,))
+
+    # Queries
+
+    def query(self, sql, *params):
+        """Run an SQL query, and return a list of the resulting rows."""
+        return self.db.execute(sql, params).fetchall()
+
+    def projects_using(self, command):
+        """Return the paths of projects containing a block with the given
+        command."""
+        return self._paths("SELECT DISTINCT project_id FROM blocks "
+                           "WHERE command = ?", command)
+
+    def projects_with_broadcast(self, name):
+        """Return the paths of projects which use the broadcast."""
+        return self._paths("SELECT project_id FROM broadcasts "
+                           "WHERE name = ?", name)
+
+    def projects_with_variable(self, name):
+        """Return the paths of projects with a variable or list with the given
+        name."""
+        return self._paths("SELECT DISTINCT project_id FROM variables "
+                           "WHERE name = ?", name)
+
+    def projects_with_script(self, script):
+        """Return the paths of projects containing a copy of the
+        :class:`Script`."""
+        return self._paths("SELECT DISTINCT project_id FROM scripts "
+                           "WHERE digest = ?", script.digest)
+
+    def projects_with_media(self, digest):
+        """Return the paths of projects containing a costume or sound with the
+        given SHA-1 digest."""
+        return self._paths("SELECT DISTINCT project_id FROM media "
+                           "WHERE digest = ?", digest)
+
+    def block_counts(self):
+        """Return a dict of the total number of blocks with each command."""
+        return dict(self.db.execute("SELECT command, SUM(count) FROM blocks "
+                                    "GROUP BY command"))
+
+    def _paths(self, sql, *params):
+        return [path for (path,) in self.db.execute(
+                "SELECT path FROM projects WHERE id IN (%s) ORDER BY path"
+                % sql, params)]
+
+    # Updating
+
+    COMMIT_EVERY = 100
+    """Number of projects to store in each transaction."""
+
+    def _store(self, results, known):
+        loaded = 0
+        try:
+            for (i, (path, mtime, hash, data)) in enumerate(results, 1):
+                project_id = known.get(path, (None,))[0]
+                if project_id is None:
+                    project_id = self.db.execute(
+                            "INSERT INTO projects (path) VALUES (?)",
+                            (path,)).lastrowid
+                self.db.execute("UPDATE projects SET mtime = ?, hash = ? "
+                                "WHERE id = ?", (mtime, hash, project_id))
+
+                if data is not None: # contents have changed
+                    loaded += 1
+                    self._delete(project_id)
+                    (format, name, error) = data['project']
+                    self.db.execute("UPDATE projects SET format = ?, "
+                                    "name = ?, error = ? WHERE id = ?",
+                                    (format, name, error, project_id))
+                    for table in TABLES:
+                        for row in data[table]:
+                            self.db.execute("INSERT INTO %s VALUES (?%s)"
+                                            % (table, ", ?" * len(row)),
+                                            (project_id,) + row)
+
+                if i % self.COMMIT_EVERY == 0:
+                    self.db.commit()
+        except:
+            self.db.rollback()
+            raise
+        self.db.commit()
+        return loaded
+
+    def _delete(self, project_id):
+        for table in TABLES:
+            self.db.execute("DELETE FROM %s WHERE project_id = ?" % table,
+                            (project_id,))
+
+
+
+def _unicode_path(path):
+    if isinstance(path, str):
+        path = path.decode(sys.getfilesystemencoding() or "utf-8")
+    return path
+
+def _extract(task):
+    """Return ``(path, mtime, hash, data)`` for the file, where data is a dict
+    of rows for each table, or None if the hash matches the old one."""
+    (path, old_hash) = task
+    mtime = os.path.getmtime(path)
+    fp = open(path, "rb")
+    hash = hashlib.sha1(fp.read()).hexdigest()
+    fp.close()
+    if hash == old_hash:
+        return (path, mtime, hash, None)
+
+    data = dict((table, []) for table in TABLES)
+    try:
+        project = kurt.Project.load(path)
+    except Exception, err:
+        data['project'] = (None, None,
+                           "%s: %s" % (err.__class__.__name__, err))
+        return (path, mtime, hash, data)
+    data['project'] = (project.format, project.name, None)
+
+    for (name, variable) in project.variables.items():
+        data['variables'].append((None, name, False))
+    for (name, list_) in project.lists.items():
+        data['variables'].append((None, name, True))
+
+    for scriptable in [project.stage] + project.sprites:
+        owner = scriptable.name
+        data['scriptables'].append((owner, scriptable is project.stage))
+        for script in scriptable.scripts:
+            if isinstance(script, kurt.Script):
+                data['scripts'].append((owner, script.digest))
+        for (command, count) in count_blocks([scriptable]).items():
+            data['blocks'].append((owner, command, count))
+        for name in scriptable.variables:
+            data['variables'].append((owner, name, False))
+        for name in scriptable.lists:
+            data['variables'].append((owner, name, True))
+        for costume in scriptable.costumes:
+            data['media'].append((owner, "costume", costume.name,
+                                  _image_digest(costume.image)))
+        for sound in scriptable.sounds:
+            data['media'].append((owner, "sound", sound.name,
+                    hashlib.sha1(sound.waveform.contents).hexdigest()))
+
+    data['broadcasts'] = [(name,) for name in set(project.get_broadcasts())]
+    return (path, mtime, hash, data)
+
+def _image_digest(image):
+    if image.format:
+        return hashlib.sha1(image.contents).hexdigest()
+    else: # only in memory, so hash the pixels
+        pil_image = image.pil_image
+        return hashlib.sha1("%s:%r:%s" % (pil_image.mode, pil_image.size,
+                                          pil_image.tobytes())).hexdigest()
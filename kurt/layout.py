@@ -0,0 +1,261 @@
+# Copyright (C) 2012 Tim Radvan
+#
+# This file is part of Kurt.
+#
+# Kurt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Kurt is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with Kurt. If not, see <http://www.gnu.org/licenses/>.
+
+"""Arranging scripts in the scripting area, so that none of them overlap.
+
+Sizes are in pixels, as Scratch 1.4 draws blocks. Heights are exact; widths
+are estimated from the length of the text. Scratch 2.0 blocks are about the
+same size, so the same layout works for both formats.
+
+"""
+
+import kurt
+
+
+
+# Hat blocks etc. whose height doesn't follow the usual rules, by their
+# Scratch 1.4 command.
+FIXED_HEIGHTS = {
+    'KeyEventHatMorph': 41,
+    'whenGreenFlag': 43,
+    'whenIReceive': 39,
+    'whenClicked': 38, # MouseClickEventHatMorph
+    'stopAll': 22,
+}
+
+# The column height used by the format plugins when saving, so huge sprites
+# don't get a scripting area tens of thousands of pixels tall.
+SAVE_COLUMN_HEIGHT = 4000
+
+
+class Layout(object):
+    """Measures blocks and scripts, and arranges scripts in the scripting area.
+
+    Sizes are worked out bottom-up without recursion, and cached: each block
+    type is only inspected once, and a block which appears more than once (eg.
+    after :meth:`BlockTable.intern <kurt.BlockTable.intern>`) is only measured
+    once. The cache assumes blocks don't change, so use a new Layout after
+    changing them.
+
+    :param column_height: If given, scripts are packed into columns no taller
+                          than this, from left to right, instead of one long
+                          column.
+
+    """
+
+    MARGIN = 20
+    """Space around the edge of the scripting area."""
+
+    SPACING = 15
+    """Space between scripts."""
+
+    CHAR_WIDTH = 7
+    """Estimated width of one character of block text."""
+
+    COMMENT_SIZE = (150, 14)
+    """``(width, height)`` of a collapsed comment."""
+
+    def __init__(self, column_height=None):
+        self.column_height = column_height
+        self._types = {}
+        self._sizes = {}
+
+    def block_height(self, block):
+        """Return the height of the block, including its arguments."""
+        return self.block_size(block)[1]
+
+    def stack_height(self, blocks):
+        """Return the height of a sequence of blocks connected together."""
+        return self.stack_size(blocks)[1]
+
+    def block_size(self, block):
+        """Return ``(width, height)`` for the block."""
+        size = self._sizes.get(id(block))
+        if size is None:
+            self._measure(block)
+            size = self._sizes[id(block)]
+        return size[1:]
+
+    def stack_size(self, blocks):
+        """Return ``(width, height)`` for a sequence of connected blocks."""
+        width = height = 0
+        for block in blocks:
+            (w, h) = self.block_size(block)
+            width = max(width, w)
+            height += h
+        return (width, height - (len(blocks) - 1) * 4)
+
+    def size(self, script):
+        """Return ``(width, height)`` for a :class:`Script` or
+        :class:`Comment`."""
+        if isinstance(script, kurt.Comment):
+            return self.COMMENT_SIZE
+        return self.stack_size(script.blocks)
+
+    def clean_up(self, scripts, keep_positions=False):
+        """Arrange the list of scripts in-place so that none of them overlap.
+
+        Scripts and comments with a position are kept in order, top-to-bottom,
+        followed by those without one.
+
+        :param keep_positions: Only move scripts without a position, by placing
+                               them below the others.
+
+        """
+        if keep_positions:
+            placed = [s for s in scripts if s.pos]
+            if len(placed) == len(scripts):
+                return
+            top = self.MARGIN
+            for script in placed:
+                top = max(top, script.pos[1] + self.size(script)[1]
+                               + self.SPACING)
+            self._arrange([s for s in scripts if not s.pos], top)
+        else:
+            scripts_with_pos = [s for s in scripts if s.pos]
+            scripts_with_pos.sort(key=lambda s: (s.pos[1], s.pos[0]))
+            self._arrange(scripts_with_pos + [s for s in scripts if not s.pos],
+                          self.MARGIN)
+
+    def _arrange(self, scripts, top):
+        x = self.MARGIN
+        y = top
+        column_width = 0
+        for script in scripts:
+            (width, height) = self.size(script)
+            if (self.column_height and y > top and
+                    y + height > top + self.column_height):
+                x += column_width + self.SPACING
+                y = top
+                column_width = 0
+            script.pos = (x, y)
+            column_width = max(column_width, width)
+            y += height + self.SPACING
+
+    def _type_info(self, block_type):
+        info = self._types.get(id(block_type))
+        if info is None:
+            command = None
+            if isinstance(block_type, kurt.BlockType):
+                if block_type.has_conversion("scratch14"):
+                    command = block_type.convert("scratch14").command
+            shapes = set(i.shape for i in block_type.inserts)
+            info = self._types[id(block_type)] = (block_type, command,
+                    block_type.shape in ('reporter', 'boolean'),
+                    block_type.shape == 'cap', 'stack' in shapes,
+                    'readonly-menu' in shapes,
+                    'number' in shapes or 'string' in shapes,
+                    len(block_type.inserts), block_type.parts)
+        return info
+
+    def _measure(self, root):
+        """Measure root and all the blocks inside it, deepest first."""
+        sizes = self._sizes
+
+        # parents come before their children, so work backwards
+        order = []
+        stack = [root]
+        while stack:
+            block = stack.pop()
+            if id(block) not in sizes:
+                order.append(block)
+                for arg in block.args:
+                    if isinstance(arg, kurt.Block):
+                        stack.append(arg)
+                    elif isinstance(arg, list):
+                        stack += arg
+
+        for block in reversed(order):
+            if id(block) not in sizes:
+                sizes[id(block)] = (block,) + self._size(block)
+
+    def _size(self, block):
+        """Return ``(width, height)``, given the sizes of the block's
+        arguments."""
+        (_, command, is_reporter, is_cap, has_stack, has_readonly_menu,
+            has_text_insert, insert_count, parts) = self._type_info(block.type)
+        sizes = self._sizes
+        args = block.args
+
+        width = 10
+        height = 17 if is_reporter else 24
+        arg_d = 3 if is_reporter else (11 if has_stack else 10)
+        has_menu = False
+        mouths = []
+
+        i = 0
+        for part in parts:
+            if not isinstance(part, kurt.Insert):
+                width += len(part) * self.CHAR_WIDTH
+                continue
+            arg = args[i] if i < len(args) else None
+            i += 1
+            if isinstance(arg, kurt.Block):
+                (_, w, h) = sizes[id(arg)]
+                width += w + 4
+                height = max(height, h + arg_d)
+            elif part.shape == 'stack':
+                mouths.append(arg or [])
+            elif isinstance(arg, list):
+                pass
+            else:
+                if part.shape == 'readonly-menu' and arg:
+                    has_menu = True
+                if isinstance(arg, kurt.Color) or arg is None:
+                    text = ""
+                elif isinstance(arg, basestring):
+                    text = arg
+                else:
+                    text = str(arg)
+                width += max(20, len(text) * self.CHAR_WIDTH + 10)
+
+        if is_reporter:
+            for arg in args[insert_count:]:
+                if isinstance(arg, kurt.Block):
+                    height = max(height, sizes[id(arg)][2] + 3)
+
+            if has_readonly_menu:
+                height += 2
+            elif has_text_insert:
+                height += 1
+        else:
+            if has_menu:
+                height += 1
+
+            if is_cap:
+                height -= 5
+
+            if has_stack:
+                for (j, arg) in enumerate(mouths):
+                    height += 9
+                    if arg:
+                        (w, h) = self.stack_size(arg)
+                        height += h - 1
+                        width = max(width, 15 + w)
+                    else:
+                        height += 14
+
+                    if j:
+                        height += 5
+
+                if command in ('doForeverIf', 'doRepeat'):
+                    height += 1
+
+        if command in FIXED_HEIGHTS:
+            height = FIXED_HEIGHTS[command]
+
+        return (width, height)
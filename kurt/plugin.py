@@ -63,11 +63,17 @@ Some things to keep in mind:
 """
 
 from collections import OrderedDict
+import copy_reg
 
 import kurt
 
 
 
+SNIFF_SIZE = 64
+"""The number of bytes from the start of a file passed to
+:attr:`KurtPlugin.sniff`."""
+
+
 class KurtPlugin(object):
     """Handles a specific file format.
 
@@ -111,8 +117,26 @@ class KurtPlugin(object):
     def __repr__(self):
         return self.__module__ + "." + self.__class__.__name__ + "()"
 
+    def __reduce__(self):
+        """Registered plugins are pickled by name."""
+        if Kurt.plugins.get(self.name) is self:
+            return (_get_plugin, (self.name,))
+        return (copy_reg.__newobj__, (self.__class__,), self.__dict__)
+
     # Override the following methods in subclass:
 
+    def sniff(self, header):
+        """Return True if a file looks like it has this format.
+
+        Used by :attr:`Project.load` to recognise files without relying on
+        the extension, so it should be cheap, and only check the header.
+
+        :param header: The first :data:`SNIFF_SIZE` bytes of the file, or the
+                       whole file if it's shorter.
+
+        """
+        return False
+
     def load(self, fp):
         """Load a project from a file with this format.
 
@@ -146,6 +170,12 @@ class Kurt(object):
 
     blocks = []
 
+    _blocks_by_command = None
+    _blocks_by_text = None
+    _blocks_by_conversion = None
+
+    _generation = 0 # bumped whenever blocks change
+
     @classmethod
     def register(cls, plugin):
         """Register a new :class:`KurtPlugin`.
@@ -184,6 +214,11 @@ class Kurt(object):
                     raise ValueError, "Couldn't match %r" % pbt._match
                 cls.blocks.append(kurt.BlockType(pbt))
 
+        # clear lookup caches
+        cls._blocks_by_command = cls._blocks_by_text = None
+        cls._blocks_by_conversion = None
+        cls._generation += 1
+
     @classmethod
     def get_plugin(cls, name=None, **kwargs):
         """Returns the first format plugin whose attributes match kwargs.
@@ -222,6 +257,14 @@ class Kurt(object):
 
         raise ValueError, "Unknown format %r" % kwargs
 
+    @classmethod
+    def sniff(cls, header):
+        """Return the first plugin which recognises the file from its header,
+        or None. See :attr:`KurtPlugin.sniff`."""
+        for plugin in cls.plugins.values():
+            if plugin.sniff(header):
+                return plugin
+
     @classmethod
     def block_by_command(cls, command):
         """Return the block with the given :attr:`command`.
@@ -229,9 +272,33 @@ class Kurt(object):
         Returns None if the block is not found.
 
         """
-        for block in cls.blocks:
-            if block.has_command(command):
-                return block
+        blocks_by_command = cls._blocks_by_command
+        if blocks_by_command is None:
+            blocks_by_command = {}
+            for block in cls.blocks:
+                for pbt in block.conversions:
+                    blocks_by_command.setdefault(pbt.command, block)
+            cls._blocks_by_command = blocks_by_command
+        return blocks_by_command.get(command)
+
+    @classmethod
+    def block_by_conversion(cls, format, command):
+        """Return the block which has a :class:`PluginBlockType` with the given
+        plugin name and :attr:`command`.
+
+        Unlike :attr:`block_by_command`, the command only has to be unique
+        within the plugin. Returns None if the block is not found.
+
+        """
+        blocks_by_conversion = cls._blocks_by_conversion
+        if blocks_by_conversion is None:
+            blocks_by_conversion = {}
+            for block in cls.blocks:
+                for pbt in block.conversions:
+                    blocks_by_conversion.setdefault((pbt.format, pbt.command),
+                                                    block)
+            cls._blocks_by_conversion = blocks_by_conversion
+        return blocks_by_conversion.get((format, command))
 
     @classmethod
     def blocks_by_text(cls, text):
@@ -240,14 +307,21 @@ class Kurt(object):
         Capitalisation and spaces are ignored.
 
         """
+        blocks_by_text = cls._blocks_by_text
+        if blocks_by_text is None:
+            blocks_by_text = {}
+            for block in cls.blocks:
+                for stripped_text in set(pbt.stripped_text
+                                         for pbt in block.conversions):
+                    blocks_by_text.setdefault(stripped_text, []).append(block)
+            cls._blocks_by_text = blocks_by_text
         text = kurt.BlockType._strip_text(text)
-        matches = []
-        for block in cls.blocks:
-            for pbt in block.conversions:
-                if pbt.stripped_text == text:
-                    matches.append(block)
-                    break
-        return matches
+        return list(blocks_by_text.get(text, []))
+
+
+def _get_plugin(name):
+    """Return the registered plugin, when unpickling."""
+    return Kurt.get_plugin(name)
 
 
 
@@ -276,6 +350,9 @@ class Feature(object):
     def __repr__(self):
         return "<Feature(%s)>" % self.name
 
+    def __reduce__(self):
+        return (_get_feature, (self.name,))
+
     def __eq__(self, other):
         if isinstance(other, basestring):
             return self.name == other
@@ -290,6 +367,10 @@ class Feature(object):
         return empty_generator()
 
 
+def _get_feature(name):
+    """Return the feature, when unpickling."""
+    return Feature.get(name)
+
 def workaround(feature):
     feature = Feature.get(feature)
     def _wrapper(f):
@@ -30,7 +30,7 @@ from kurt.plugin import Kurt, KurtPlugin, block_workaround
 
 from kurt.scratch14.objtable import *
 from kurt.scratch14.blocks import block_list
-from kurt.scratch14.heights import clean_up
+from kurt.layout import Layout, SAVE_COLUMN_HEIGHT
 from kurt.scratch14.user_objects import make_user_objects, user_objects_by_name
 
 # :class:`FixedObjects` have a ``.value`` property to access their value.
@@ -606,7 +606,7 @@ class Serializer(object):
             kurt_scriptable.position = (x, y)
 
     def save_scriptable(self, kurt_scriptable, v14_scriptable):
-        clean_up(kurt_scriptable.scripts)
+        Layout(SAVE_COLUMN_HEIGHT).clean_up(kurt_scriptable.scripts)
 
         v14_scriptable.scripts = map(self.save_script, kurt_scriptable.scripts)
 
@@ -680,6 +680,9 @@ class Scratch14Plugin(KurtPlugin):
     serializer_cls = Serializer
     user_objects = make_user_objects(user_objects_by_name)
 
+    def sniff(self, header):
+        return header.startswith("ScratchV0")
+
     def load(self, fp):
         return self.serializer_cls(self).load(fp)
 
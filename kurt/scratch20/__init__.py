@@ -23,9 +23,12 @@ import time
 import os
 import hashlib
 import struct
+import tempfile
 
 import kurt
 from kurt.plugin import Kurt, KurtPlugin
+from kurt.layout import Layout, SAVE_COLUMN_HEIGHT
+from kurt.scratch20 import jsonstream
 
 from kurt.scratch20.blocks import make_block_types, custom_block, make_spec
 
@@ -64,10 +67,42 @@ def get_blocks_by_id(this_block):
                         yield b
 
 
+class _FileView(object):
+    """Reads a file from its own position.
+
+    Every member ZipFile opens from a file object reads on from wherever that
+    one file is, so reading another member in between would corrupt it.
+
+    """
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.pos = fp.tell()
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_SET:
+            self.pos = offset
+        elif whence == os.SEEK_CUR:
+            self.pos += offset
+        else:
+            self.fp.seek(offset, whence)
+            self.pos = self.fp.tell()
+
+    def tell(self):
+        return self.pos
+
+    def read(self, size=-1):
+        self.fp.seek(self.pos)
+        data = self.fp.read(size)
+        self.pos += len(data)
+        return data
+
+
 class ZipReader(object):
     def __init__(self, fp):
+        self.fp = fp
         self.zip_file = zipfile.ZipFile(fp, "r")
-        self.json = json.load(self.zip_file.open("project.json"))
+        self.json = {} # the stage, without its children
         self.project = kurt.Project()
         self.list_watchers = []
         self.loaded_images = {}
@@ -86,23 +121,42 @@ class ZipReader(object):
             else:
                 self.image_filenames[int(name)] = filename
 
-        # info
-        self.project.tempo = self.json['tempoBPM']
-        self.project.notes = self.json['info'].get('comment', u"")
-        self.project.author = self.json['info'].get('author', u"")
-
-        # stage
-        self.project.stage = self.load_scriptable(self.json, is_stage=True)
+    def iter_children(self):
+        """Read project.json into :attr:`json`, and yield the dicts from its
+        ``children`` list one at a time, so each one can be loaded and then
+        thrown away before the next is decoded."""
+        if isinstance(self.fp, basestring):
+            fp = self.zip_file.open("project.json") # opens its own handle
+        else:
+            # costumes and sounds are read in between
+            fp = zipfile.ZipFile(_FileView(self.fp)).open("project.json")
+        for (key, value) in jsonstream.iter_object(fp, arrays=["children"]):
+            if key == "children":
+                for cd in value:
+                    yield cd
+            else:
+                self.json[key] = value
 
+    def load_project(self):
         # sprites
         actors = []
-        for cd in self.json['children']:
+        for cd in self.iter_children():
             if 'objName' in cd:
                 sprite = self.load_scriptable(cd)
                 self.project.sprites.append(sprite)
                 actors.append(sprite)
             else:
                 actors.append(cd)
+        sprite_list_watchers = self.list_watchers
+        self.list_watchers = []
+
+        # info
+        self.project.tempo = self.json['tempoBPM']
+        self.project.notes = self.json['info'].get('comment', u"")
+        self.project.author = self.json['info'].get('author', u"")
+
+        # stage
+        self.project.stage = self.load_scriptable(self.json, is_stage=True)
 
         # watchers
         for actor in actors:
@@ -111,7 +165,28 @@ class ZipReader(object):
                 actor = self.load_watcher(actor)
             self.project.actors.append(actor)
 
+        self.project.actors += self.list_watchers + sprite_list_watchers
+
+    def load_sprites(self, names):
+        """Load only the named sprites, and only read their costumes and
+        sounds from the zip."""
+        sprites_by_name = {}
+        for cd in self.iter_children():
+            if cd.get('objName') in names:
+                sprites_by_name[cd['objName']] = self.load_scriptable(cd)
+                if len(sprites_by_name) == len(set(names)):
+                    break # don't read the rest
+
+        sprites = []
+        for name in names:
+            if name not in sprites_by_name:
+                raise ValueError, "No sprite named %r" % name
+            sprite = sprites_by_name[name]
+            self.project.sprites.append(sprite)
+            self.project.actors.append(sprite)
+            sprites.append(sprite)
         self.project.actors += self.list_watchers
+        return sprites
 
     def read_image(self, file_id):
         if file_id not in self.loaded_images:
@@ -308,10 +383,9 @@ class ZipWriter(object):
         self.image_dicts = {}
         self.waveform_dicts = {}
 
-        self.json = {
+        self.json = { # the stage, without its children
             "penLayerMD5": "279467d0d49e152706ed66539b577c00.png",
             "tempoBPM": project.tempo,
-            "children": [],
             "info": {
                 "comment": project.notes,
                 "author": project.author,
@@ -328,19 +402,38 @@ class ZipWriter(object):
         }
 
         self.json.update(self.save_scriptable(project.stage))
-        sprites = {}
-        for (i, sprite) in enumerate(project.sprites):
-            sprites[sprite.name] = self.save_scriptable(sprite, i)
+
+        # project.json is written to a temporary file one child at a time,
+        # so the whole thing is never in memory at once
+        (handle, path) = tempfile.mkstemp(suffix=".json")
+        try:
+            with os.fdopen(handle, "wb") as fp:
+                self.write_project_json(fp, project)
+            self.zip_file.write(path, "project.json", zipfile.ZIP_DEFLATED)
+        finally:
+            os.remove(path)
+        self.zip_file.getinfo("project.json").external_attr = 0777 << 16L
+
+    def write_project_json(self, fp, project):
+        """Write project.json to the file, saving each sprite just before it's
+        written."""
+        fp.write("{")
+        for (key, value) in self.json.items():
+            fp.write("%s: %s, " % (json.dumps(key), json.dumps(value)))
+        fp.write('"children": [')
+
+        indexes = dict((s.name, i) for (i, s) in enumerate(project.sprites))
+        separator = ""
         for actor in project.actors:
             if isinstance(actor, kurt.Sprite):
-                actor = sprites[actor.name]
+                actor = self.save_scriptable(actor, indexes[actor.name])
             elif isinstance(actor, kurt.Watcher):
                 actor = self.save_watcher(actor)
 
             if actor:
-                self.json["children"].append(actor)
-
-        self.write_file("project.json", json.dumps(self.json))
+                fp.write(separator + json.dumps(actor))
+                separator = ", "
+        fp.write("]}")
 
     def finish(self):
         self.zip_file.close()
@@ -420,6 +513,10 @@ class ZipWriter(object):
     def save_scriptable(self, scriptable, i=None):
         is_sprite = isinstance(scriptable, kurt.Sprite)
 
+        # place any scripts which don't have a position yet
+        Layout(SAVE_COLUMN_HEIGHT).clean_up(scriptable.scripts,
+                                            keep_positions=True)
+
         sd = {
             "objName": scriptable.name,
             "currentCostumeIndex": scriptable.costume_index or 0,
@@ -584,8 +681,14 @@ class Scratch20Plugin(KurtPlugin):
     ]
     blocks = make_block_types()
 
+    def sniff(self, header):
+        # project.json is usually the last member, so the zip signature is
+        # all there is to go on. ZipReader fails straight away without it.
+        return header.startswith("PK\x03\x04")
+
     def load(self, fp):
         zl = ZipReader(fp)
+        zl.load_project()
         zl.project._original = zl.json
         zl.finish()
         return zl.project
@@ -598,3 +701,32 @@ class Scratch20Plugin(KurtPlugin):
 
 
 Kurt.register(Scratch20Plugin())
+
+
+def load_sprites(path, names):
+    """Load some of the sprites from a Scratch 2.0 project file, without
+    loading the rest of the project.
+
+    Only the parts of the file used by those sprites are read, so this is much
+    faster than :attr:`Project.load` for a few sprites from a big project.
+
+    The sprites belong to a new :class:`Project`, which has an empty stage,
+    and contains only those sprites and their list watchers.
+
+    :param path:  Path or file pointer.
+    :param names: The names of the sprites to load.
+
+    :raises: :py:class:`ValueError` if there's no sprite with one of the
+             names.
+
+    :returns: a list of the :class:`Sprite` objects, in the same order as
+              ``names``.
+
+    """
+    zl = ZipReader(path)
+    try:
+        sprites = zl.load_sprites(names)
+    finally:
+        zl.finish()
+    zl.project.convert("scratch20")
+    return sprites
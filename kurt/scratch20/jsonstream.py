@@ -0,0 +1,173 @@
+# Copyright (C) 2012 Tim Radvan
+#
+# This file is part of Kurt.
+#
+# Kurt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Kurt is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with Kurt. If not, see <http://www.gnu.org/licenses/>.
+
+"""Reading a big JSON object a piece at a time.
+
+:func:`iter_object` yields the members of the top-level object one by one,
+and can yield the items of an array member one by one too, so only one item
+has to be decoded and kept in memory at once::
+
+    for (key, value) in iter_object(fp, arrays=["children"]):
+        if key == "children":
+            for child in value:
+                ...
+
+"""
+
+import re
+import json
+
+
+
+CHUNK_SIZE = 64 * 1024
+
+WHITESPACE = " \t\n\r"
+
+NEAR_END = 8 # such as a cut-off "\uXXXX" escape
+
+_decoder = json.JSONDecoder()
+
+_ERROR_POS = re.compile(r"\(char (\d+)\)")
+
+_WORD_END = re.compile(r"(-|[a-z]+)\Z")
+
+_NUMBER_END = re.compile(r"[-+.eE0-9]*\Z")
+
+
+def iter_object(fp, arrays=()):
+    """Yield ``(key, value)`` for each member of the JSON object in the file.
+
+    :param fp:     A file pointer to read the JSON from.
+    :param arrays: Keys of array members to yield as an iterator over their
+                   items, instead of a list. Any items not used by the time
+                   the next member is asked for are skipped.
+
+    :raises: :py:class:`ValueError` if the JSON is invalid.
+
+    """
+    reader = _Reader(fp)
+    reader.expect("{")
+    if reader.peek() == "}":
+        reader.next()
+        return
+    while True:
+        key = reader.decode()
+        reader.expect(":")
+        if key in arrays:
+            items = reader.iter_array()
+            yield (key, items)
+            for _ in items: # skip the rest
+                pass
+        else:
+            yield (key, reader.decode())
+        if reader.next() == "}":
+            break
+        reader.back(",")
+
+
+class _Reader(object):
+    def __init__(self, fp):
+        self.fp = fp
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def read(self, size=None):
+        """Read more of the file into the buffer. Returns False at the end of
+        the file."""
+        if self.eof:
+            return False
+        data = self.fp.read(size or CHUNK_SIZE)
+        if not data:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Return the next character which isn't whitespace, without using
+        it up."""
+        while True:
+            while self.pos < len(self.buffer):
+                if self.buffer[self.pos] not in WHITESPACE:
+                    return self.buffer[self.pos]
+                self.pos += 1
+            if not self.read():
+                raise ValueError, "Unexpected end of JSON"
+
+    def next(self):
+        char = self.peek()
+        self.pos += 1
+        return char
+
+    def back(self, char):
+        """Check that the last character was ``char``."""
+        if self.buffer[self.pos - 1] != char:
+            raise ValueError, "Expected %r at %r" % (char,
+                    self.buffer[self.pos - 1:self.pos + 20])
+
+    def expect(self, char):
+        self.next()
+        self.back(char)
+
+    def decode(self):
+        """Decode the next JSON value."""
+        self.peek()
+        while True:
+            try:
+                (value, end) = _decoder.raw_decode(self.buffer, self.pos)
+            except ValueError, err:
+                # incomplete, so read as much again as we have already
+                if self.incomplete(err) and self.read(
+                        max(CHUNK_SIZE, len(self.buffer) - self.pos)):
+                    continue
+                raise
+            # a number might carry on, eg. "1." of "1.5"
+            if _NUMBER_END.match(self.buffer, end) and self.read():
+                continue
+            self.pos = end
+            return value
+
+    def incomplete(self, err):
+        """Return True if the decode error could be from the value carrying
+        on past the end of the buffer, rather than invalid JSON."""
+        message = str(err)
+        if message.startswith(("Unterminated string", "end is out of bounds")):
+            return True
+        m = _ERROR_POS.search(message)
+        if m:
+            return int(m.group(1)) >= len(self.buffer) - NEAR_END
+        # no position for a bad value in an object, so see if the buffer
+        # stops before or in the middle of one
+        tail = self.buffer.rstrip(WHITESPACE)[-NEAR_END:]
+        if not tail or tail[-1] in "[{,:":
+            return True
+        m = _WORD_END.search(tail)
+        return bool(m) and any(word.startswith(m.group())
+                               for word in ("-", "true", "false", "null"))
+
+    def iter_array(self):
+        self.expect("[")
+        if self.peek() == "]":
+            self.next()
+            return
+        while True:
+            yield self.decode()
+            if self.next() == "]":
+                break
+            self.back(",")
@@ -0,0 +1,356 @@
+# Copyright (C) 2012 Tim Radvan
+#
+# This file is part of Kurt.
+#
+# Kurt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Kurt is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Kurt. If not, see <http://www.gnu.org/licenses/>.
+
+"""A local conversion server, so that converting a file doesn't have to wait
+for Kurt to be imported first.
+
+The server listens for HTTP on localhost, and runs jobs in a pool of worker
+processes which have already imported Kurt. Start it with
+``util/kurtserve.py serve``, and talk to it with :class:`Client`::
+
+    import kurt.server
+    client = kurt.server.Client()
+    client.convert("game.sb", "game.sb2")
+
+Each request is a POST of a JSON object with the ``job`` name and its
+parameters, with a ``Content-Type`` of ``application/json`` and the server's
+token in the ``X-Kurt-Token`` header. The response is a JSON object with the
+result, or with an ``error`` message. Jobs:
+
+* ``convert`` (``source``, ``output``): convert a file. Returns the ``output``
+  path and the ``warnings``.
+* ``info`` (``path``, ``parts``): return a summary of a project, as
+  :func:`kurt.corpus.summarize`.
+* ``load`` (``path``): load a project and keep it in the server. Returns a
+  ``handle`` for it, and its ``format`` and ``name``. Only the most recently
+  used projects are kept.
+* ``save`` (``handle``, ``output``): save a loaded project. Returns the
+  ``output`` path and the ``warnings``.
+* ``close`` (``handle``): forget a loaded project.
+
+Paths are read and written by the server, so they should be absolute. The
+server can read and write any file its user can, so it only listens on
+localhost, and turns away requests without its token, so that web pages can't
+send it jobs. ``kurtserve.py serve`` writes the token to :data:`TOKEN_FILE`,
+where :class:`Client` reads it from by default.
+
+"""
+
+import os
+import hmac
+import json
+import time
+import itertools
+import threading
+import httplib
+import multiprocessing
+import BaseHTTPServer
+import SocketServer
+from collections import OrderedDict
+from cStringIO import StringIO
+
+import kurt
+
+
+
+DEFAULT_ADDRESS = ("127.0.0.1", 8108)
+
+TOKEN_FILE = os.path.expanduser("~/.kurtserve-token")
+
+TOKEN_HEADER = "X-Kurt-Token"
+
+JOBS = {
+    'convert': ('source', 'output'),
+    'info': ('path',),
+    'load': ('path',),
+    'save': ('handle', 'output'),
+    'close': ('handle',),
+}
+"""The required parameters of each job."""
+
+
+class ServerError(Exception):
+    """A job failed, or the server couldn't understand the request.
+
+    Raised by :class:`Client`.
+
+    """
+
+
+class _Timeout(Exception):
+    pass
+
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Serves conversion jobs over HTTP.
+
+    Requests are handled in threads, and the jobs run in a pool of worker
+    processes, so several jobs can run at once.
+
+    :param address: ``(host, port)`` to listen on.
+    :param workers: Number of worker processes. Defaults to the number of
+                    CPUs.
+    :param cache:   A :class:`kurt.cache.ConversionCache` or path to one, for
+                    ``convert`` jobs.
+    :param token:   The token clients must send. Defaults to a new random one,
+                    which is kept in :attr:`token`.
+    :param timeout: Seconds after which to give up on a job. The workers are
+                    then restarted, in case one is stuck.
+    :param max_projects: How many loaded projects to keep. The least recently
+                    used are forgotten first.
+
+    """
+
+    daemon_threads = True
+
+    allow_reuse_address = True
+
+    def __init__(self, address=DEFAULT_ADDRESS, workers=None, cache=None,
+                 token=None, timeout=600, max_projects=100):
+        if isinstance(cache, basestring):
+            cache = kurt.cache.ConversionCache(cache)
+        self.token = token or os.urandom(16).encode("hex")
+        self.timeout = timeout
+        self.max_projects = max_projects
+        self.workers = workers
+        self.cache = cache
+        self.pool = multiprocessing.Pool(workers, _init_worker, (cache,))
+        self.projects = OrderedDict() # least recently used first
+        self._handles = itertools.count(1)
+        self._lock = threading.Lock()
+        BaseHTTPServer.HTTPServer.__init__(self, address, _RequestHandler)
+
+    def server_close(self):
+        BaseHTTPServer.HTTPServer.server_close(self)
+        self.pool.terminate()
+        self.pool.join()
+
+    def run_job(self, job, params):
+        """Run the job, and return the result dict."""
+        if job == "convert":
+            return self._apply(_convert, (params['source'], params['output']))
+        elif job == "info":
+            return self._apply(kurt.corpus.summarize, (params['path'],
+                    params.get('parts') or kurt.corpus.PARTS))
+        elif job == "load":
+            (snapshot, result) = self._apply(_load, (params['path'],))
+            with self._lock:
+                handle = str(next(self._handles))
+                self.projects[handle] = snapshot
+                while len(self.projects) > self.max_projects:
+                    self.projects.popitem(last=False)
+            result['handle'] = handle
+            return result
+        elif job == "save":
+            with self._lock:
+                snapshot = self.projects.pop(params['handle'], None)
+                if snapshot is not None: # now the most recently used
+                    self.projects[params['handle']] = snapshot
+            if snapshot is None:
+                raise ValueError, "Unknown handle %r" % params['handle']
+            return self._apply(_save, (snapshot, params['output']))
+        else: # close
+            with self._lock:
+                self.projects.pop(params['handle'], None)
+            return {}
+
+    def _apply(self, func, args):
+        """Run ``func(*args)`` in a worker process, and return the result.
+
+        :raises: :class:`_Timeout` after :attr:`timeout` seconds.
+
+        """
+        with self._lock:
+            pool = self.pool
+            result = pool.apply_async(func, args)
+        started = time.time()
+        while True:
+            # a job lost with a dead process never finishes, so don't block
+            try:
+                return result.get(0.1)
+            except multiprocessing.TimeoutError:
+                pass
+            with self._lock:
+                if self.pool is not pool:
+                    # restarted for another job, so send this one again
+                    pool = self.pool
+                    result = pool.apply_async(func, args)
+                    started = time.time()
+                elif self.timeout and time.time() - started > self.timeout:
+                    pool.terminate()
+                    self.pool = multiprocessing.Pool(self.workers,
+                            _init_worker, (self.cache,))
+                    raise _Timeout("Timed out after %s seconds"
+                                   % self.timeout)
+
+
+class _RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        content_type = self.headers.getheader('content-type') or ""
+        if content_type.split(";")[0].strip().lower() != "application/json":
+            return self.respond(415, {'error': "Expected application/json"})
+        token = self.headers.getheader(TOKEN_HEADER) or ""
+        if not hmac.compare_digest(token, self.server.token):
+            return self.respond(403, {'error': "Wrong token"})
+
+        try:
+            length = int(self.headers.getheader('content-length') or 0)
+            request = json.loads(self.rfile.read(length))
+            params = dict((str(k), v) for (k, v) in request.items())
+            job = params.pop('job')
+        except (ValueError, KeyError, AttributeError):
+            return self.respond(400, {'error': "Invalid request"})
+        if job not in JOBS:
+            return self.respond(400, {'error': "Unknown job %r" % job})
+        for name in JOBS[job]:
+            if name not in params:
+                return self.respond(400, {'error': "Missing %s" % name})
+
+        try:
+            result = self.server.run_job(job, params)
+        except _Timeout, err:
+            return self.respond(504, {'error': str(err)})
+        except Exception, err:
+            return self.respond(500, {'error': "%s: %s" % (
+                    err.__class__.__name__, err)})
+        self.respond(200, result)
+
+    def respond(self, status, result):
+        body = json.dumps(result)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+
+class Client(object):
+    """Sends jobs to a :class:`Server`.
+
+    Relative paths are made absolute before they're sent.
+
+    :param token: The server's token. Defaults to the one in the token file.
+
+    :raises: :class:`ServerError` if a job fails.
+
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS, timeout=None, token=None):
+        self.address = address
+        self.timeout = timeout
+        self.token = token or read_token()
+
+    def convert(self, source, output):
+        """Convert the file at ``source`` to ``output``.
+
+        :returns: ``(output, warnings)``
+
+        """
+        result = self.request("convert", source=os.path.abspath(source),
+                              output=os.path.abspath(output))
+        return (result['output'], result['warnings'])
+
+    def info(self, path, parts=None):
+        """Return a summary of the project. See
+        :func:`kurt.corpus.summarize`."""
+        return self.request("info", path=os.path.abspath(path), parts=parts)
+
+    def load(self, path):
+        """Load the project into the server, and return a handle for it."""
+        return self.request("load", path=os.path.abspath(path))['handle']
+
+    def save(self, handle, output):
+        """Save a loaded project.
+
+        :returns: ``(output, warnings)``
+
+        """
+        result = self.request("save", handle=handle,
+                              output=os.path.abspath(output))
+        return (result['output'], result['warnings'])
+
+    def close(self, handle):
+        """Forget a loaded project."""
+        self.request("close", handle=handle)
+
+    def request(self, job, **params):
+        """Send a job, and return the result dict."""
+        params['job'] = job
+        (host, port) = self.address
+        connection = httplib.HTTPConnection(host, port, timeout=self.timeout)
+        try:
+            connection.request("POST", "/", json.dumps(params),
+                               {"Content-Type": "application/json",
+                                TOKEN_HEADER: self.token})
+            response = connection.getresponse()
+            result = json.loads(response.read())
+        finally:
+            connection.close()
+        if response.status != 200:
+            raise ServerError(result.get('error'))
+        return result
+
+
+
+def write_token(token, path=TOKEN_FILE):
+    """Save the token to a file only the user can read."""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600)
+    os.fchmod(fd, 0600)
+    with os.fdopen(fd, "w") as fp:
+        fp.write(token)
+
+def read_token(path=TOKEN_FILE):
+    """Return the token saved by :func:`write_token`."""
+    with open(path) as fp:
+        return fp.read().strip()
+
+
+
+#-- Jobs (run in the worker processes) --#
+
+_cache = None
+
+def _init_worker(cache):
+    global _cache
+    _cache = cache
+
+def _convert(source, output):
+    if _cache is not None:
+        warnings = _cache.convert_file(source, output)
+    else:
+        project = kurt.Project.load(source)
+        warnings = []
+        output = project.save(output, warnings=warnings)
+        warnings = [unicode(w) for w in warnings]
+    return {'output': output, 'warnings': warnings}
+
+def _load(path):
+    project = kurt.Project.load(path)
+    fp = StringIO()
+    project.save_snapshot(fp)
+    return (fp.getvalue(), {'format': project.format, 'name': project.name})
+
+def _save(snapshot, output):
+    project = kurt.Project.load_snapshot(StringIO(snapshot))
+    warnings = []
+    output = project.save(output, warnings=warnings)
+    return {'output': output, 'warnings': [unicode(w) for w in warnings]}
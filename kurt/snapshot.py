@@ -0,0 +1,262 @@
+# Copyright (C) 2012 Tim Radvan
+#
+# This file is part of Kurt.
+#
+# Kurt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Kurt is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with Kurt. If not, see <http://www.gnu.org/licenses/>.
+
+"""A binary snapshot of a :class:`Project`, for caching projects between
+processes. Much faster to load than the original file.
+
+Use :attr:`Project.save_snapshot` and :attr:`Project.load_snapshot`.
+
+The file contains::
+
+    MAGIC
+    header and body lengths     (two little-endian unsigned 64-bit ints)
+    header                      (pickle: version, block types, blob offsets)
+    body                        (pickle: the project)
+    blobs                       (media file contents, one after another)
+
+Blocks refer to their type by its format and command, rather than pickling the
+whole :class:`BlockType`. Scripts are stored as flat arrays, so deeply nested
+scripts don't hit the recursion limit. Each costume and sound is stored as a
+blob, and identical media are only stored once. When loading from a path, the
+file is memory-mapped, and only the blob data is copied.
+
+Snapshots are meant as a cache: they are only readable by the same version of
+Kurt.
+
+"""
+
+import mmap
+import struct
+import hashlib
+import cPickle
+from cStringIO import StringIO
+
+import PIL.Image
+
+import kurt
+
+
+
+MAGIC = "KURTSNAP"
+
+VERSION = (1, kurt.__version__)
+
+LENGTHS = struct.Struct("<QQ")
+
+
+def save(project, fp):
+    """Write a snapshot of the project to the file object."""
+    types = []
+    type_indexes = {}
+    blobs = []
+    blob_indexes = {}
+
+    def type_index(block_type):
+        index = type_indexes.get(id(block_type))
+        if index is None:
+            index = type_indexes[id(block_type)] = len(types)
+            if isinstance(block_type, kurt.BlockType):
+                pbt = block_type.convert()
+                types.append((pbt.format, pbt.command))
+            else: # CustomBlockType
+                types.append(block_type)
+        return index
+
+    def blob_index(data):
+        key = hashlib.sha1(data).digest()
+        index = blob_indexes.get(key)
+        if index is None:
+            index = blob_indexes[key] = len(blobs)
+            blobs.append(data)
+        return index
+
+    def persistent_id(obj):
+        if isinstance(obj, kurt.Script):
+            return ("script", obj.pos) + _encode(obj.blocks, type_index)
+        elif isinstance(obj, kurt.Block):
+            return ("block",) + _encode([obj], type_index)
+        elif isinstance(obj, kurt.BaseBlockType):
+            return ("type", type_index(obj))
+        elif isinstance(obj, kurt.Image):
+            if obj._contents or obj._path:
+                return ("image", blob_index(obj.contents), obj.format,
+                        obj._size)
+            else:
+                pil_image = obj.pil_image
+                return ("pixels", blob_index(pil_image.tobytes()),
+                        pil_image.mode, pil_image.size)
+        elif isinstance(obj, kurt.Waveform):
+            return ("wave", blob_index(obj.contents), obj._rate,
+                    obj._sample_count)
+        elif isinstance(obj, kurt.plugin.KurtPlugin):
+            return ("plugin", obj.name)
+
+    body = StringIO()
+    pickler = cPickle.Pickler(body, cPickle.HIGHEST_PROTOCOL)
+    pickler.persistent_id = persistent_id
+    pickler.dump(project)
+    body = body.getvalue()
+
+    offsets = []
+    offset = 0
+    for data in blobs:
+        offsets.append((offset, len(data)))
+        offset += len(data)
+    header = cPickle.dumps((VERSION, types, offsets), cPickle.HIGHEST_PROTOCOL)
+
+    fp.write(MAGIC)
+    fp.write(LENGTHS.pack(len(header), len(body)))
+    fp.write(header)
+    fp.write(body)
+    for data in blobs:
+        fp.write(data)
+
+
+def load(fp):
+    """Load a :class:`Project` from a snapshot file object, starting at its
+    current position.
+
+    :raises: :py:class:`ValueError` if the file isn't a snapshot from this
+             version of Kurt.
+
+    """
+    try:
+        data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        base = fp.tell() # the map is of the whole file
+    except (AttributeError, EnvironmentError, ValueError):
+        data = fp.read()
+        base = 0
+    try:
+        return _load(data, base)
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
+
+def _load(data, base=0):
+    start = base + len(MAGIC) + LENGTHS.size
+    if data[base:base + len(MAGIC)] != MAGIC:
+        raise ValueError, "Not a Kurt snapshot"
+    (header_length, body_length) = LENGTHS.unpack(
+            data[base + len(MAGIC):start])
+    (version, types, offsets) = cPickle.loads(
+            data[start:start + header_length])
+    if version != VERSION:
+        raise ValueError, "Snapshot is from a different version: %r" % (
+                version,)
+    body_start = start + header_length
+    blobs_start = body_start + body_length
+
+    for (i, ref) in enumerate(types):
+        if isinstance(ref, tuple):
+            types[i] = kurt._get_block_type(*ref)
+
+    blobs = {}
+    def blob(index):
+        if index not in blobs:
+            (offset, length) = offsets[index]
+            offset += blobs_start
+            blobs[index] = data[offset:offset + length]
+        return blobs[index]
+
+    def persistent_load(pid):
+        kind = pid[0]
+        if kind == "script":
+            script = kurt.Script.__new__(kurt.Script)
+            script.__setstate__({'blocks': _decode(pid[2], pid[3], types),
+                                 'pos': pid[1]})
+            return script
+        elif kind == "block":
+            return _decode(pid[1], pid[2], types)[0]
+        elif kind == "type":
+            return types[pid[1]]
+        elif kind == "image":
+            image = kurt.Image(blob(pid[1]), pid[2])
+            image._size = pid[3]
+            return image
+        elif kind == "pixels":
+            return kurt.Image(PIL.Image.frombytes(pid[2], pid[3],
+                                                  blob(pid[1])))
+        elif kind == "wave":
+            return kurt.Waveform(blob(pid[1]), pid[2], pid[3])
+        elif kind == "plugin":
+            return kurt.plugin.Kurt.get_plugin(pid[1])
+        raise ValueError, "Unknown snapshot object %r" % (kind,)
+
+    unpickler = cPickle.Unpickler(StringIO(data[body_start:blobs_start]))
+    unpickler.persistent_load = persistent_load
+    return unpickler.load()
+
+
+
+def _encode(blocks, type_index):
+    """Flatten a list of blocks into ``(ops, values)``.
+
+    ``ops`` has a character for each item, in pre-order: ``"S"`` for a list
+    of blocks, followed by its length in ``values``; ``"B"`` for a block,
+    followed by its type, comment, and number of arguments; and ``"V"`` for
+    any other argument, followed by the value itself.
+
+    """
+    ops = []
+    values = []
+    stack = [blocks]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, kurt.Block):
+            args = item.args
+            ops.append("B")
+            values += (type_index(item.type), item.comment, len(args))
+            stack.extend(reversed(args))
+        elif isinstance(item, list):
+            ops.append("S")
+            values.append(len(item))
+            stack.extend(reversed(item))
+        else:
+            ops.append("V")
+            values.append(item)
+    return ("".join(ops), values)
+
+def _decode(ops, values, types):
+    """Return the list of blocks from :func:`_encode`."""
+    values = iter(values)
+    frames = [] # [remaining, items, type, comment]
+    result = None
+    for op in ops:
+        if op == "B":
+            block_type = types[next(values)]
+            comment = next(values)
+            frames.append([next(values), [], block_type, comment])
+        elif op == "S":
+            frames.append([next(values), [], None, None])
+        else:
+            frames[-1][1].append(next(values))
+            frames[-1][0] -= 1
+
+        while frames and frames[-1][0] == 0:
+            (_, items, block_type, comment) = frames.pop()
+            if block_type is None:
+                item = items
+            else:
+                item = kurt.Block.__new__(kurt.Block)
+                item.__setstate__({'type': block_type, 'args': items,
+                                   'comment': comment})
+            if frames:
+                frames[-1][1].append(item)
+                frames[-1][0] -= 1
+            else:
+                result = item
+    return result
@@ -24,9 +24,18 @@ http://wiki.scratch.mit.edu/wiki/Block_Plugin
 This parser supports most of the block plugin syntax. Most notably, using < >
 for boolean shaped blocks is not supported.
 
+Comments start with ``//``. A comment at the end of a line is attached to the
+stack block on that line, and lines containing only a comment carry on the
+comment above. A script made only of comment lines is parsed as a free-floating
+:class:`kurt.Comment`. This is how :meth:`kurt.Script.stringify` writes them.
+
+All the state used during a parse lives on a :class:`Parser` instance, so
+separate Parsers can be used from different threads at the same time.
+
 """
 
 import re
+import sys
 from collections import OrderedDict
 
 import kurt
@@ -45,7 +54,7 @@ class symbol(Token):
     lbp = 0
 
 class literal(Token):
-    def nud(self):
+    def nud(self, parser):
         return self.value
 
 class number(Token):
@@ -54,42 +63,41 @@ class number(Token):
         if int(value) == value:
             value = int(value)
         self.value = value
-    def nud(self):
+    def nud(self, parser):
         return self
 
 class string(Token):
     lbp = 0
-    def nud(self):
+    def nud(self, parser):
         return self
 
 class color(Token):
-    def nud(self):
+    def nud(self, parser):
         self.value = kurt.Color(self.value)
         return self
 
 class lparen(Token):
     lbp = 0
-    def nud(self):
-        global token
-        contents = expression()
+    def nud(self, parser):
+        contents = parser.expression()
         if isinstance(contents, rparen): # empty brackets
             return
-        if not isinstance(token, rparen):
+        if not isinstance(parser.token, rparen):
             raise SyntaxError("Expected bracket to match %s" % self.value)
-        token = next()
+        parser.token = parser.next()
         return contents
 
 class rparen(Token):
     lbp = 0
-    def nud(self):
+    def nud(self, parser):
         return self
 
 class newline(symbol):
     name = "EOL"
     lbp = 3
-    def nud(self):
+    def nud(self, parser):
         return []
-    def led(self, left):
+    def led(self, parser, left):
         if isinstance(left, kurt.Block):
             left = [left]
         return left
@@ -124,181 +132,154 @@ def all_the_blocks():
             yield block
             done_text.add(block.text)
 
-def match_part(part, block_part):
-    if isinstance(block_part, kurt.Insert):
-        return (isinstance(part, (Token, kurt.Block, list)))
-    else:
-        return (block_part.strip() == part)
+class PartNode(object):
+    """A node in the trie returned by :func:`part_trie`."""
 
-def blocks_starting_with(parts):
-    suppress_blocks = set(suppress_block_names())
+    __slots__ = ('children', 'blocks', 'expect', 'ends')
 
+    def __init__(self):
+        self.children = {}
+        self.blocks = [] # whose parts start with the prefix
+        self.expect = [] # the part after the prefix, for each of blocks
+        self.ends = [] # whose parts are exactly the prefix
+
+def build_part_trie():
+    root = PartNode()
     for block in all_the_blocks():
-        if len(parts) > len(block.parts):
-            continue
-        if (isinstance(block.parts[0], basestring)
-                and block.parts[0].strip() in suppress_blocks):
-            continue
-        for (p, bp) in zip(parts, block.parts):
-            if not match_part(p, bp):
-                break
-        else:
-            yield block
+        node = root
+        for part in block.parts:
+            if isinstance(part, kurt.Insert):
+                key = None # inserts match any argument
+                next_part = part
+            else:
+                key = next_part = part.strip()
+            node.blocks.append(block)
+            node.expect.append(next_part)
+            child = node.children.get(key)
+            if child is None:
+                child = node.children[key] = PartNode()
+            node = child
+        node.blocks.append(block)
+        node.expect.append(None)
+        node.ends.append(block)
+
+    first_inserts = set()
+    for block in kurt.plugin.Kurt.blocks:
+        if isinstance(block.parts[0], kurt.Insert):
+            first_inserts.add(block.parts[0].kind)
+    return (root, first_inserts)
 
-def next_block_part(parts):
-    for block in blocks_starting_with(parts):
-        next_part = (block.parts[len(parts)]
-                     if len(block.parts) > len(parts)
-                     else None)
-        if isinstance(next_part, basestring):
-            next_part = next_part.strip()
-        yield next_part
+_part_trie = (None, None, None)
 
-def blocks_by_parts(parts):
-    for block in all_the_blocks():
-        if len(parts) != len(block.parts):
-            continue
-        for (p, bp) in zip(parts, block.parts):
-            if not match_part(p, bp):
-                break
-        else:
-            yield block
+def part_trie():
+    """Return ``(root, kinds)``.
+
+    ``root`` is a trie of :class:`PartNode` indexing every block by its parts.
+    Text segments are keyed on their stripped text, and inserts on None.
+    ``kinds`` is the set of insert kinds that blocks start with.
+
+    Built once, and again only if new blocks are registered.
 
-def block_from_parts(parts):
-    args = []
+    """
+    global _part_trie
+    (generation, root, kinds) = _part_trie
+    if generation != kurt.plugin.Kurt._generation:
+        generation = kurt.plugin.Kurt._generation
+        (root, kinds) = build_part_trie()
+        _part_trie = (generation, root, kinds)
+    return (root, kinds)
+
+def find_parts(parts):
+    """Return the :class:`PartNode` for the given parts, or None."""
+    (node, kinds) = part_trie()
     for part in parts:
         if isinstance(part, (Token, kurt.Block, list)):
-            args.append(part)
-
-    failure = ""
-    for block in blocks_by_parts(parts):
-        block_args = []
-        for (arg, insert) in zip(args, block.inserts):
-            if isinstance(arg, Token):
-                if (isinstance(arg, iden) and
-                        not insert.shape in ("number-menu", "readonly-menu")):
-                    arg = kurt.Block(arg.value)
-                elif (isinstance(arg, iden) and
-                        insert.shape in ("number-menu", "readonly-menu") and
-                        arg not in insert.options()):
-                    try:
-                        arg = kurt.Block(arg.value)
-                    except kurt.UnknownBlock:
-                        arg = arg.value
-                else:
-                    arg = arg.value
-            elif (isinstance(arg, kurt.Block) and
-                    arg.type.text in insert.options(context)):
-                arg = arg.type.text
-
-            ok = False
-            if insert.shape == "string" or insert.kind == "broadcast":
-                if isinstance(arg, (int, long, float, complex, str)):
-                    arg = unicode(arg)
-                ok = isinstance(arg, (unicode, kurt.Block))
-            elif insert.shape == "color":
-                ok = isinstance(arg, kurt.Color)
-            elif insert.shape == "boolean":
-                ok = arg is None or (isinstance(arg, kurt.Block)
-                                     and arg.type.shape == "boolean")
-            elif insert.shape == "stack":
-                ok = isinstance(arg, list)
-            elif insert.shape in ("number", "number-menu", "readonly-menu"):
-                if insert.shape in ("number", "number-menu"):
-                    if isinstance(arg, basestring):
-                        try:
-                            arg = float(arg)
-                            arg = int(arg) if int(arg) == arg else arg
-                        except ValueError:
-                            pass
-                    if isinstance(arg, (int, long, float, complex,
-                                        kurt.Block)):
-                        ok = True
-                if insert.shape in ("readonly-menu", "number-menu"):
-                    if (str(arg) in insert.options(context)
-                            or isinstance(arg, kurt.Block)):
-                        ok = True
-
-            if not ok:
-                failure = "%r doesn't fit %s" % (arg, insert.shape)
-                if insert.kind:
-                    failure += " " + insert.kind
-                break
-            block_args.append(arg)
+            key = None
+        elif isinstance(part, basestring):
+            key = part
         else:
-            return kurt.Block(block, *block_args)
-    else:
-        throw("Wrong type of arguments to block: %s" % failure, repr(parts))
+            return None
+        node = node.children.get(key)
+        if node is None:
+            return None
+    return node
+
+def blocks_by_parts(parts):
+    node = find_parts(parts)
+    return iter(node.ends if node else [])
 
 class iden(Token):
     @property
     def lbp(self):
         return PRECEDENCE.get(self.value, 100)
 
-    def nud(self):
+    def nud(self, parser):
         try:
-            return self.parse_block([self.value])
+            return self.parse_block(parser, [self.value])
         except SyntaxError:
             for block in inline_blocks():
-                if self.value in block.inserts[0].options(context):
+                if self.value in parser.menu_options(block.inserts[0]):
                     return kurt.Block(block, self.value)
 
-            if len(self.parts) == 1 and self.value in set(make_menu_tokens()):
+            if (len(self.parts) == 1 and
+                    self.value in set(parser.make_menu_tokens())):
                 return iden(self.value)
             else:
                 raise
 
-    def led(self, left):
+    def led(self, parser, left):
         if isinstance(left, list):
-            return left + [self.parse_block([self.value])]
+            return left + [self.parse_block(parser, [self.value])]
         else:
-            return self.parse_block([left, self.value])
+            return self.parse_block(parser, [left, self.value])
 
-    def parse_block(self, parts):
-        global token
+    def parse_block(self, parser, parts):
         self.parts = parts
+        lineno = parser.lineno
         while 1:
-            part = self.parse_one_part(parts)
+            part = self.parse_one_part(parser, parts)
             if part is not None:
                 if isinstance(part, rparen):
                     part = False
                 parts.append(part)
             else:
-                block = block_from_parts(parts)
-                if isinstance(token, end_token):
+                block = parser.block_from_parts(parts)
+                if block.type.shape not in ("reporter", "boolean"):
+                    parser.block_lines[lineno] = block # for comments
+                if isinstance(parser.token, end_token):
                     return block
 
                 if block.type.has_insert("stack"):
-                    if not token.value == "end":
-                        throw("Expected 'end' after C mouth")
-                    token = next()
+                    if not parser.token.value == "end":
+                        parser.throw("Expected 'end' after C mouth")
+                    parser.token = parser.next()
                 return block
 
-    def parse_one_part(self, parts):
-        global token, next
-        expect = set(next_block_part(parts))
+    def parse_one_part(self, parser, parts):
+        expect = set(parser.next_block_part(parts))
         if not expect:
             self.parts = parts
-            throw("Can't find block %r" % parts)
+            parser.throw("Can't find block %r" % parts)
 
         if expect == set(['']):
             return ''
 
         all_inserts = filter(lambda p: isinstance(p, kurt.Insert), expect)
 
+        token = parser.token
         if isinstance(token, iden):
             text_segments = filter(lambda p: isinstance(p, basestring), expect)
-            menu_inserts = filter(lambda i: i.options(context), all_inserts)
+            menu_inserts = filter(parser.menu_options, all_inserts)
 
             if token.value in text_segments:
                 part = token.value
-                token = next()
+                parser.token = parser.next()
                 return part
 
             for insert in menu_inserts:
-                if token.value in insert.options(context):
+                if token.value in parser.menu_options(insert):
                     part = token
-                    token = next()
+                    parser.token = parser.next()
                     return part
 
         if None in expect:
@@ -309,17 +290,17 @@ class iden(Token):
             if isinstance(token, end_token):
                 part = []
             else:
-                part = expression(1)
+                part = parser.expression(1)
             assert isinstance(part, list)
             return part
 
         if isinstance(token, (newline, end_token)):
-            throw("Unexpected EOL", expected=expect)
+            parser.throw("Unexpected EOL", expected=expect)
 
         if all_inserts:
-            return expression(self.lbp)
+            return parser.expression(self.lbp)
 
-        throw("Wrong argument", expected=expect)
+        parser.throw("Wrong argument", expected=expect)
 
 
 #-- Tokenizer --#
@@ -339,6 +320,7 @@ TOKENS = [(re.compile(r), cls) for (r, cls) in [
     (r'end', symbol),
     (r'(-?[0-9]+(\.[0-9]+)?)', number),
     (r'\[(#[A-Fa-f0-9]{3,6})\]', color),
+    (r'(#[A-Fa-f0-9]{6})(?![A-Za-z0-9])', color), # as Color.stringify()
     (r'\[([^\]]+?)( v)?\]', string),
     (r'\"([^"]+)\"', string),
     (r"\'([^']+)\'", string),
@@ -349,7 +331,27 @@ TOKENS = [(re.compile(r), cls) for (r, cls) in [
     (r'\n|\r|\r\n', newline),
 ]]
 
+def combine_tokens(tokens):
+    """Combine token patterns into one, whose alternatives are tried in order.
+
+    Returns ``(pattern, groups)``. ``groups`` maps the name of each
+    alternative's group to ``(cls, index)``, where ``index`` is the group
+    holding the token's contents, or None to use the whole match.
+
+    """
+    pattern = re.compile("|".join("(?P<t%d>%s)" % (i, pat.pattern)
+                                  for (i, (pat, cls)) in enumerate(tokens)))
+    groups = {}
+    for (i, (pat, cls)) in enumerate(tokens):
+        name = "t%d" % i
+        index = pattern.groupindex[name] + 1 if pat.groups else None
+        groups[name] = (cls, index)
+    return (pattern, groups)
+
+(TOKEN_PAT, TOKEN_GROUPS) = combine_tokens(TOKENS)
+
 NEWLINE_PAT = re.compile(r'\n|\r|\r\n')
+COMMENT_PAT = re.compile(r'[ \t]*// ?([^\r\n]*)')
 SEPARATOR_PAT = re.compile(r'[^A-Za-z:#%+*-,=<?>]')
 WHITESPACE_PAT = re.compile(r'[ \t]+')
 
@@ -370,114 +372,522 @@ def make_block_tokens():
     for alias in SEGMENT_ALIASES:
         yield alias
 
-def make_menu_tokens():
-    global context
+def make_static_menu_tokens():
     for kind in kurt.Insert.KIND_OPTIONS:
         if kind == "broadcast": continue
-        for o in kurt.Insert(None, kind).options(context):
+        for o in kurt.Insert(None, kind).options():
             yield str(o)
 
-def suppress_block_names():
-    for block in kurt.plugin.Kurt.blocks:
-        if isinstance(block.parts[0], kurt.Insert):
-            for o in block.parts[0].options(context):
-                yield o
-
-def tokenize(program):
-    block_tokens = sorted(set(make_block_tokens()) | set(make_menu_tokens()))
-    block_tokens.sort(key=len, reverse=True)
-    block_tokens = filter(lambda x: not x.isdigit(), block_tokens)
-    block_tokens = filter(None, block_tokens)
-
-    global remain, lineno
-    remain = program
-    lineno = 1
-    while remain:
-        m = WHITESPACE_PAT.match(remain)
-        if m:
-            remain = remain[m.end():]
-            if not remain:
+class TokenTrie(object):
+    """Finds the longest known token at a position in the input.
+
+    A token only matches if it's followed by a separator or the end of the
+    input.
+
+    """
+
+    def __init__(self, tokens=()):
+        self.root = {}
+        for token in tokens:
+            self.add(token)
+
+    def add(self, token):
+        node = self.root
+        for char in token:
+            node = node.setdefault(char, {})
+        node[None] = token
+
+    def match(self, text, pos=0):
+        """Return the longest token found at ``text[pos:]``, or None."""
+        length = len(text)
+        node = self.root
+        found = None
+        while 1:
+            if None in node and (pos == length or
+                                 SEPARATOR_PAT.match(text, pos)):
+                found = node[None]
+            if pos == length:
                 break
+            node = node.get(text[pos])
+            if node is None:
+                break
+            pos += 1
+        return found
+
+def useful_tokens(tokens):
+    return set(t for t in tokens if t and not t.isdigit())
+
+_static_tokens = (None, frozenset(), TokenTrie())
+
+def static_tokens():
+    """Return ``(tokens, trie)`` for the tokens which don't depend on context.
+
+    Built once, and again only if new blocks are registered.
+
+    """
+    global _static_tokens
+    (generation, tokens, trie) = _static_tokens
+    if generation != kurt.plugin.Kurt._generation:
+        generation = kurt.plugin.Kurt._generation
+        tokens = frozenset(useful_tokens(make_block_tokens()) |
+                           useful_tokens(make_static_menu_tokens()))
+        trie = TokenTrie(tokens)
+        _static_tokens = (generation, tokens, trie)
+    return (tokens, trie)
+
+_context_tries = {}
+
+def context_trie(tokens):
+    """Return a cached :class:`TokenTrie` for the given context tokens."""
+    tokens = frozenset(tokens)
+    trie = _context_tries.get(tokens)
+    if trie is None:
+        if len(_context_tries) > 100:
+            _context_tries.clear()
+        trie = _context_tries[tokens] = TokenTrie(tokens)
+    return trie
+
+def tokenize(program, scriptable=None):
+    """Yield the tokens in program. Shortcut for :meth:`Parser.tokenize`."""
+    return Parser(scriptable).tokenize(program)
+
+
+
+#-- Parser --#
+
+class Parser(object):
+    """Parses block plugin syntax into :class:`kurt.Script` objects.
+
+    A Parser can be reused for any number of parses, one at a time.
+
+    :param scriptable: The default :class:`kurt.Scriptable` to parse in the
+                       context of, eg. for looking up variable names.
+
+    """
+
+    def __init__(self, scriptable=None):
+        self.scriptable = scriptable
+        """The default context for :meth:`parse`."""
+
+        self._reset("", scriptable)
+
+    def _reset(self, program, context):
+        self.program = program # for errors
+        self.context = context
+        self.pos = 0 # of the next token
+        self.lineno = 1
+        self.comments = {} # lineno: text
+        self.block_lines = {} # lineno: stack block starting on that line
+        self.token = None
+        self.next = None
+        self._menu_options = {}
+        self._suppressed = None
+
+    def parse(self, program, scriptable=None):
+        """Parse the program, and return a :class:`kurt.Script`.
+
+        :param scriptable: Context to use instead of :attr:`scriptable`.
+
+        """
+        if scriptable is None:
+            scriptable = self.scriptable
+        self._reset(program, scriptable)
+        return self._parse(program)
+
+    def parse_many(self, document, scriptable=None, workers=None):
+        """Parse a document containing many scripts.
+
+        Scripts are separated by empty lines. A heading line such as ``==
+        Sprite1 ==`` means the scripts after it are for the sprite with that
+        name, or the stage. See :func:`split_scripts`.
+
+        The context for each scriptable is only set up once, so this is much
+        faster than calling :meth:`parse` for each script.
+
+        :param scriptable: Context for scripts before the first heading, to
+                           use instead of :attr:`scriptable`.
+        :param workers:    If given, parse in this many processes at once.
+
+        :returns: list of ``(scriptable, script)`` pairs, in document order.
+
+        """
+        if scriptable is None:
+            scriptable = self.scriptable
+
+        contexts = []
+        tasks = []
+        for (name, lineno, start, text) in split_scripts(document):
+            context = scriptable
+            if name is not None:
+                context = find_scriptable(scriptable, name)
+                if context is None:
+                    raise SyntaxError("Unknown sprite %r" % name,
+                                      ('<string>', lineno, start, text))
+            for (index, other) in enumerate(contexts):
+                if other is context:
+                    break
+            else:
+                index = len(contexts)
+                contexts.append(context)
+            tasks.append((index, lineno, start, text))
+
+        if workers and len(tasks) > 1:
+            import multiprocessing
+            pool = multiprocessing.Pool(workers, _init_worker, (contexts,))
+            try:
+                scripts = pool.map(_parse_in_worker, tasks)
+            finally:
+                pool.terminate()
+        else:
+            scripts = []
+            current = None
+            for (index, lineno, start, text) in tasks:
+                if current != index:
+                    self._reset(text, contexts[index])
+                    current = index
+                scripts.append(self._parse_at(text, lineno, start))
+
+        return [(contexts[index], script) for ((index, lineno, start, text),
+                                               script) in zip(tasks, scripts)]
+
+    def _parse_at(self, program, lineno, start):
+        """Parse a script found at the given line and offset of a document.
+
+        Errors are reported relative to the document.
+
+        """
+        try:
+            return self._parse(program)
+        except SyntaxError, err:
+            if err.lineno is None:
+                raise
+            moved = SyntaxError(err.msg, (err.filename,
+                                          err.lineno + lineno - 1,
+                                          err.offset + start, err.text))
+            moved.expected = getattr(err, 'expected', None)
+            raise moved, None, sys.exc_info()[2]
+
+    def _parse(self, program):
+        lines = NEWLINE_PAT.split(program.strip("\r\n"))
+        matches = [COMMENT_PAT.match(line) for line in lines]
+        if all(m and m.end() == len(line) for (m, line) in zip(matches,
+                                                               lines)):
+            return kurt.Comment("\n".join(m.group(1) for m in matches))
+
+        self.comments = {}
+        self.block_lines = {}
+        self.next = self.tokenize(program).next
+        self.token = self.next()
+        result = self.expression()
+        if not isinstance(self.token, end_token):
+            self.throw("Expected end of input")
+        if isinstance(result, kurt.Block):
+            result = [result]
+        if not isinstance(result, list):
+            self.throw("Result does not evaluate to a block")
+        for (lineno, text) in self.comments.items():
+            if lineno in self.block_lines:
+                self.block_lines[lineno].comment = text
+        return kurt.Script(result)
+
+    def expression(self, rbp=0):
+        t = self.token
+        self.token = self.next()
+        left = t.nud(self)
+        if not hasattr(self.token, "lbp"):
+            self.throw("Not an operator: %r" % self.token)
+        while rbp < self.token.lbp:
+            t = self.token
+            self.token = self.next()
+            left = t.led(self, left)
+            if not hasattr(self.token, "lbp"):
+                self.throw("Not an operator: %r" % self.token)
+        return left
+
+    def tokenize(self, program):
+        """Yield the tokens in program."""
+        (static, static_trie) = static_tokens()
+        tries = [static_trie, context_trie(
+                useful_tokens(self.make_menu_tokens()) - static)]
+
+        self.program = program
+        self.pos = 0
+        self.lineno = 1
+        line_start = 0
+        comment_line = None # the line of the comment being written
+        length = len(program)
+        while self.pos < length:
+            m = WHITESPACE_PAT.match(program, self.pos)
+            if m:
+                self.pos = m.end()
+                if self.pos == length:
+                    break
+
+            if program.startswith("//", self.pos):
+                m = COMMENT_PAT.match(program, self.pos)
+                if program[line_start:self.pos].strip():
+                    comment_line = self.lineno
+                    self.comments[comment_line] = m.group(1)
+                    self.pos = m.end()
+                    continue
+                # a line on its own carries on the comment above
+                if comment_line is not None:
+                    self.comments[comment_line] += "\n" + m.group(1)
+                self.pos = m.end()
+                m = NEWLINE_PAT.match(program, self.pos)
+                if m:
+                    self.pos = line_start = m.end()
+                    self.lineno += 1
+                continue
+
+            if comment_line != self.lineno:
+                comment_line = None # only the lines right below carry it on
 
-        for (pat, cls) in TOKENS:
-            m = pat.match(remain)
+            m = TOKEN_PAT.match(program, self.pos)
             if m:
-                if m.groups():
-                    contents = m.group(1)
+                (cls, index) = TOKEN_GROUPS[m.lastgroup]
+                if index:
+                    contents = m.group(index)
                 else:
                     contents = m.group(0).strip()
                 yield cls(contents)
-                remain = remain[m.end():]
+                self.pos = m.end()
                 if cls == newline:
-                    lineno += 1
-                break
+                    self.lineno += 1
+                    line_start = self.pos
+            else:
+                value = None
+                for trie in tries:
+                    found = trie.match(program, self.pos)
+                    if found and (value is None or len(found) > len(value)):
+                        value = found
+                if value is None:
+                    end = program.find("\n", self.pos)
+                    if end == -1:
+                        end = length
+                    self.throw("Unknown token at %r" % program[self.pos:end])
+                yield iden(SEGMENT_ALIASES.get(value, value))
+                self.pos += len(value)
+        yield end_token()
+
+    def menu_options(self, insert):
+        """Return the set of options for a menu insert, given the context.
+
+        The options only depend on the insert's kind, so they're worked out
+        once per kind and cached until the next call to :meth:`parse`.
+
+        """
+        if insert.kind not in self._menu_options:
+            self._menu_options[insert.kind] = frozenset(
+                    insert.options(self.context))
+        return self._menu_options[insert.kind]
+
+    def make_menu_tokens(self):
+        for kind in kurt.Insert.KIND_OPTIONS:
+            if kind == "broadcast": continue
+            for o in self.menu_options(kurt.Insert(None, kind)):
+                yield str(o)
+
+    def suppress_block_names(self):
+        """Return the set of menu options which blocks can start with.
+
+        Blocks whose first text segment is one of these aren't matched.
+
+        """
+        if self._suppressed is None:
+            (root, kinds) = part_trie()
+            suppressed = set()
+            for kind in kinds:
+                suppressed |= self.menu_options(kurt.Insert(None, kind))
+            self._suppressed = frozenset(suppressed)
+        return self._suppressed
+
+    def _blocks_starting_with(self, parts):
+        """Return ``(blocks, expect)`` for the blocks starting with parts."""
+        node = find_parts(parts)
+        if node is None:
+            return ([], [])
+        if parts:
+            if (isinstance(parts[0], basestring) and
+                    parts[0] in self.suppress_block_names()):
+                return ([], [])
+            return (node.blocks, node.expect)
         else:
-            for value in block_tokens:
-                if remain.startswith(value):
-                    after_value = remain[len(value):]
-                    if not after_value or SEPARATOR_PAT.match(after_value[0]):
-                        value = SEGMENT_ALIASES.get(value, value)
-                        yield iden(value)
-                        remain = after_value
-                        break
+            suppressed = self.suppress_block_names()
+            blocks = []
+            expect = []
+            for (block, next_part) in zip(node.blocks, node.expect):
+                if not (isinstance(block.parts[0], basestring) and
+                        block.parts[0].strip() in suppressed):
+                    blocks.append(block)
+                    expect.append(next_part)
+            return (blocks, expect)
+
+    def blocks_starting_with(self, parts):
+        return iter(self._blocks_starting_with(parts)[0])
+
+    def next_block_part(self, parts):
+        return iter(self._blocks_starting_with(parts)[1])
+
+    def block_from_parts(self, parts):
+        args = []
+        for part in parts:
+            if isinstance(part, (Token, kurt.Block, list)):
+                args.append(part)
+
+        failure = ""
+        for block in blocks_by_parts(parts):
+            block_args = []
+            for (arg, insert) in zip(args, block.inserts):
+                if isinstance(arg, Token):
+                    if (isinstance(arg, iden) and
+                            not insert.shape in ("number-menu",
+                                                 "readonly-menu")):
+                        arg = kurt.Block(arg.value)
+                    elif (isinstance(arg, iden) and
+                            insert.shape in ("number-menu", "readonly-menu")
+                            and arg not in insert.options()):
+                        try:
+                            arg = kurt.Block(arg.value)
+                        except kurt.UnknownBlock:
+                            arg = arg.value
+                    else:
+                        arg = arg.value
+                elif (isinstance(arg, kurt.Block) and
+                        arg.type.text in self.menu_options(insert)):
+                    arg = arg.type.text
+
+                ok = False
+                if insert.shape == "string" or insert.kind == "broadcast":
+                    if isinstance(arg, (int, long, float, complex, str)):
+                        arg = unicode(arg)
+                    ok = isinstance(arg, (unicode, kurt.Block))
+                elif insert.shape == "color":
+                    ok = isinstance(arg, kurt.Color)
+                elif insert.shape == "boolean":
+                    ok = arg is None or (isinstance(arg, kurt.Block)
+                                         and arg.type.shape == "boolean")
+                elif insert.shape == "stack":
+                    ok = isinstance(arg, list)
+                elif insert.shape in ("number", "number-menu",
+                                      "readonly-menu"):
+                    if insert.shape in ("number", "number-menu"):
+                        if isinstance(arg, basestring):
+                            try:
+                                arg = float(arg)
+                                arg = int(arg) if int(arg) == arg else arg
+                            except ValueError:
+                                pass
+                        if isinstance(arg, (int, long, float, complex,
+                                            kurt.Block)):
+                            ok = True
+                    if insert.shape in ("readonly-menu", "number-menu"):
+                        if (str(arg) in self.menu_options(insert)
+                                or isinstance(arg, kurt.Block)):
+                            ok = True
+
+                if not ok:
+                    failure = "%r doesn't fit %s" % (arg, insert.shape)
+                    if insert.kind:
+                        failure += " " + insert.kind
+                    break
+                block_args.append(arg)
             else:
-                throw("Unknown token at %r" % remain.split("\n")[0])
-    yield end_token()
+                return kurt.Block(block, *block_args)
+        else:
+            self.throw("Wrong type of arguments to block: %s" % failure,
+                       repr(parts))
 
+    def throw(self, msg, hint=None, expected=None):
+        if expected:
+            repr_expected = map(repr, expected)
+            hint = "Expected %s" % (repr_expected[0]
+                                    if len(repr_expected) == 1
+                                    else "one of " + ", ".join(repr_expected))
 
+        if hint:
+            msg += ". " + hint
 
-#-- Parser --#
+        line = NEWLINE_PAT.split(self.program)[self.lineno - 1]
+        offset = self.pos #- len(token.value)
+        err = SyntaxError(msg, ('<string>', self.lineno, offset, line))
+        err.expected = expected
+        raise err
 
-p_input = ""
-
-def expression(rbp=0):
-    global token
-    t = token
-    token = next()
-    left = t.nud()
-    if not hasattr(token, "lbp"):
-        throw("Not an operator: %r" % token)
-    while rbp < token.lbp:
-        t = token
-        token = next()
-        left = t.led(left)
-        if not hasattr(token, "lbp"):
-            throw("Not an operator: %r" % token)
-    return left
 
 def parse(program, scriptable):
-    global token, next, context, p_input
+    """Parse the program, and return a :class:`kurt.Script`.
+
+    Shortcut for :meth:`Parser.parse`.
 
-    # for errors
-    p_input = program
+    """
+    return Parser(scriptable).parse(program)
 
-    context = scriptable
-    next = tokenize(program).next
-    token = next()
-    result = expression()
-    if not isinstance(token, end_token):
-        throw("Expected end of input")
-    if isinstance(result, kurt.Block):
-        result = [result]
-    if not isinstance(result, list):
-        throw("Result does not evaluate to a block")
-    return kurt.Script(result)
+def parse_many(document, scriptable, workers=None):
+    """Parse a document containing many scripts.
 
+    Shortcut for :meth:`Parser.parse_many`.
 
-def throw(msg, hint=None, expected=None):
-    global remain
+    """
+    return Parser(scriptable).parse_many(document, workers=workers)
 
-    if expected:
-        repr_expected = map(repr, expected)
-        hint = "Expected %s" % (repr_expected[0] if len(repr_expected) == 1
-                                else "one of " + ", ".join(repr_expected))
 
-    if hint:
-        msg += ". " + hint
 
-    line = NEWLINE_PAT.split(p_input)[lineno - 1]
-    offset = len(p_input) - len(remain) #- len(token.value)
-    err = SyntaxError(msg, ('<string>', lineno, offset, line))
-    err.expected = expected
-    raise err
+#-- Documents --#
 
+HEADING_PAT = re.compile(r'==\s*(.+?)\s*==\s*$')
+
+def split_scripts(document):
+    """Split a document into the scripts it contains.
+
+    Scripts are separated by empty lines. A heading line such as ``== Sprite1
+    ==`` starts the scripts for the sprite or stage with that name.
+
+    Yields ``(name, lineno, start, text)`` for each script, where ``name`` is
+    the last heading or None, and ``lineno`` and ``start`` are the line and
+    offset in the document that the script starts at.
+
+    """
+    name = None
+    lines = []
+    pos = 0
+    for (i, line) in enumerate(document.splitlines(True), 1):
+        content = line.rstrip("\r\n")
+        heading = HEADING_PAT.match(content)
+        if heading or not content:
+            if lines:
+                yield (name, lineno, start, "".join(lines).rstrip("\r\n"))
+                lines = []
+            if heading:
+                name = heading.group(1)
+        else:
+            if not lines:
+                (lineno, start) = (i, pos)
+            lines.append(line)
+        pos += len(line)
+    if lines:
+        yield (name, lineno, start, "".join(lines).rstrip("\r\n"))
+
+def find_scriptable(scriptable, name):
+    """Return the stage or sprite with the given name from scriptable's
+    project, or None."""
+    project = scriptable.project if scriptable is not None else None
+    if project is None:
+        return None
+    if name == project.stage.name:
+        return project.stage
+    return project.get_sprite(name)
+
+_worker_contexts = []
+_worker_parsers = {}
+
+def _init_worker(contexts):
+    global _worker_contexts
+    _worker_contexts = contexts
+
+def _parse_in_worker((index, lineno, start, text)):
+    parser = _worker_parsers.get(index)
+    if parser is None:
+        parser = _worker_parsers[index] = Parser(_worker_contexts[index])
+        parser._reset(text, parser.scriptable)
+    return parser._parse_at(text, lineno, start)
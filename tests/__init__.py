@@ -1,5 +1,7 @@
 import pickle
 import os
+import json
+from StringIO import StringIO
 import unittest
 from kurt import kurt
 
@@ -26,3 +28,727 @@ class TestPickle(unittest.TestCase):
         self.assertEqual(original._pil_image.size, restored._pil_image.size)
         self.assertEqual(original._pil_image.tobytes(),
                          restored._pil_image.tobytes())
+
+    def test_pickle_script(self):
+        script = kurt.Script([
+            kurt.Block("say:duration:elapsed:from:", "Hello!", 2),
+            kurt.Block("penColor:", kurt.Color("#faa41a")),
+        ], pos=(10, 20))
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            restored = pickle.loads(pickle.dumps(script, protocol))
+            self.assertEqual(script, restored)
+            self.assertEqual(script.pos, restored.pos)
+
+    def test_pickle_by_reference(self):
+        block = kurt.Block("say:duration:elapsed:from:", "Hello!", 2)
+        pbt = block.type.convert("scratch20")
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            self.assertIs(pickle.loads(pickle.dumps(block.type, protocol)),
+                          block.type)
+            self.assertIs(pickle.loads(pickle.dumps(pbt, protocol)), pbt)
+        self.assertLess(len(pickle.dumps(block, pickle.HIGHEST_PROTOCOL)),
+                        200)
+
+    def test_pickle_sb2(self):
+        test_file = os.path.join(SELF_PATH, 'v20', 'default.sb2')
+        proj = kurt.Project.load(test_file)
+        restored = pickle.loads(pickle.dumps(proj, pickle.HIGHEST_PROTOCOL))
+        self.assertIs(restored._plugin, proj._plugin)
+        self.assertEqual(restored.sprites[0].scripts, proj.sprites[0].scripts)
+
+
+class TestProject(unittest.TestCase):
+
+    def test_get_sprite_after_rename(self):
+        proj = kurt.Project()
+        sprite = kurt.Sprite(proj, "Sprite1")
+        proj.sprites.append(sprite)
+        self.assertIs(proj.get_sprite("Sprite1"), sprite)
+        sprite.name = "Cat"
+        self.assertIsNone(proj.get_sprite("Sprite1"))
+        self.assertIs(proj.get_sprite("Cat"), sprite)
+        proj.sprites.remove(sprite)
+        self.assertIsNone(proj.get_sprite("Cat"))
+
+    def test_broadcasts_after_change(self):
+        proj = kurt.Project()
+        inner = kurt.Block("broadcast:", "ping")
+        proj.stage.scripts.append(kurt.Script([
+            kurt.Block("whenIReceive", "go"),
+            kurt.Block("doForever", [inner]),
+        ]))
+        self.assertEqual(sorted(proj.get_broadcasts()), ["go", "ping"])
+        inner.args[0] = "pong"
+        self.assertEqual(sorted(proj.get_broadcasts()), ["go", "pong"])
+        option = kurt.Insert("readonly-menu", "broadcast")
+        self.assertIn("pong", option.options(proj.stage))
+
+    def test_broadcasts_after_mouth_change(self):
+        proj = kurt.Project()
+        loop = kurt.Block("doForever", [])
+        proj.stage.scripts.append(kurt.Script([kurt.Block("whenGreenFlag"),
+                                               loop]))
+        loop.args[0] = []
+        self.assertEqual(list(proj.get_broadcasts()), [])
+        loop.args[0].append(kurt.Block("broadcast:", "hi"))
+        self.assertEqual(list(proj.get_broadcasts()), ["hi"])
+        loop.args[:] = [[kurt.Block("broadcast:", "ho")]]
+        loop.args[0][0].args[0] = "yo"
+        self.assertEqual(list(proj.get_broadcasts()), ["yo"])
+
+    def test_dump_text(self):
+        proj = kurt.Project()
+        sprite = kurt.Sprite(proj, "Sprite1")
+        proj.sprites.append(sprite)
+        proj.stage.scripts.append(kurt.Script([
+            kurt.Block("whenGreenFlag"),
+            kurt.Block("doForever", [kurt.Block("forward:", 10)]),
+        ]))
+        sprite.scripts.append(kurt.Script([kurt.Block("say:", "Hello!")]))
+        fp = StringIO()
+        proj.dump_text(fp)
+
+        copy = kurt.Project()
+        copy.sprites.append(kurt.Sprite(copy, "Sprite1"))
+        copy.parse(fp.getvalue())
+        self.assertEqual(copy.stage.scripts, proj.stage.scripts)
+        self.assertEqual(copy.sprites[0].scripts, sprite.scripts)
+
+    def test_bytes(self):
+        data = open(os.path.join(SELF_PATH, 'game.sb'), "rb").read()
+        proj = kurt.Project.from_bytes(data)
+        self.assertEqual(proj.format, "scratch14")
+        sb2 = proj.to_bytes("scratch20", warnings=[])
+        self.assertEqual(proj.format, "scratch14")
+        copy = kurt.Project.from_bytes(sb2)
+        self.assertEqual(copy.format, "scratch20")
+        self.assertEqual(copy.sprites[0].name, "Sprite1")
+        self.assertRaises(kurt.UnknownFormat, kurt.Project.from_bytes, "foo")
+
+    def test_sniff(self):
+        import shutil
+        import tempfile
+        folder = tempfile.mkdtemp()
+        try:
+            path = os.path.join(folder, "game.sb2") # actually a 1.4 file
+            shutil.copy(os.path.join(SELF_PATH, 'game.sb'), path)
+            proj = kurt.Project.load(path)
+            self.assertEqual(proj.format, "scratch14")
+            self.assertEqual(proj.name, "game")
+        finally:
+            shutil.rmtree(folder)
+        self.assertIsNone(kurt.plugin.Kurt.sniff("GIF89a"))
+
+    def test_dump_text_comments(self):
+        path = os.path.join(SELF_PATH, 'v20', 'comments.sb2')
+        proj = kurt.Project.load(path)
+        fp = StringIO()
+        proj.dump_text(fp)
+
+        copy = kurt.Project.load(path)
+        for scriptable in [copy.stage] + copy.sprites:
+            del scriptable.scripts[:]
+        copy.parse(fp.getvalue())
+        self.assertIsInstance(copy.sprites[0].scripts[0], kurt.Comment)
+        output = StringIO()
+        copy.dump_text(output)
+        self.assertEqual(output.getvalue(), fp.getvalue())
+
+    def test_load_sprites(self):
+        proj = kurt.Project.load(os.path.join(SELF_PATH, 'game.sb'))
+        data = proj.to_bytes("scratch20", warnings=[])
+        proj = kurt.Project.from_bytes(data)
+        (sprite,) = kurt.scratch20.load_sprites(StringIO(data), ["Sprite1"])
+        self.assertEqual(sprite.project.sprites, [sprite])
+        self.assertEqual(sprite.scripts, proj.sprites[0].scripts)
+        self.assertEqual(len(sprite.costumes), len(proj.sprites[0].costumes))
+        self.assertRaises(ValueError, kurt.scratch20.load_sprites,
+                          StringIO(data), ["Nope"])
+
+    def test_load_big_sb2(self):
+        import random
+        import string
+        import zipfile
+        proj = kurt.Project.load(os.path.join(SELF_PATH, 'game.sb'))
+        rand = random.Random(1)
+        for i in range(60):
+            sprite = proj.sprites[0].copy()
+            sprite.name = "S%d" % i
+            sprite.project = proj
+            sprite.variables['junk'] = kurt.Variable("".join(
+                    rand.choice(string.letters) for _ in range(6000)))
+            proj.sprites.append(sprite)
+        data = proj.to_bytes("scratch20", warnings=[])
+        info = zipfile.ZipFile(StringIO(data)).getinfo("project.json")
+        self.assertGreater(info.compress_size, 64 * 1024) # several reads
+
+        copy = kurt.Project.from_bytes(data)
+        self.assertEqual(copy.get_sprite("S59").variables['junk'].value,
+                         proj.get_sprite("S59").variables['junk'].value)
+        (sprite,) = kurt.scratch20.load_sprites(StringIO(data), ["S59"])
+        self.assertEqual(len(sprite.costumes), len(proj.sprites[0].costumes))
+
+    def test_load_save_async(self):
+        data = open(os.path.join(SELF_PATH, 'game.sb'), "rb").read()
+        chunks = (data[i:i + 4096] for i in range(0, len(data), 4096))
+        proj = kurt.Project.load_async(chunks, "scratch14").get()
+        self.assertEqual(proj.sprites[0].name, "Sprite1")
+
+        output = []
+        self.assertIsNone(proj.save_async(output.append).get())
+        copy = kurt.Project.load_async(["".join(output)], "scratch14").get()
+        self.assertEqual(copy.sprites[0].scripts, proj.sprites[0].scripts)
+        self.assertRaises(kurt.UnknownFormat,
+                          kurt.Project.load_async(StringIO("foo")).get)
+
+
+class TestDigest(unittest.TestCase):
+
+    def test_digest_changes_with_nested_block(self):
+        inner = kurt.Block("forward:", 10)
+        script = kurt.Script([kurt.Block("whenGreenFlag"),
+                              kurt.Block("doRepeat", 4, [inner])])
+        original = script.digest
+        inner.args[0] = 20
+        self.assertNotEqual(script.digest, original)
+        inner.args[0] = 10
+        self.assertEqual(script.digest, original)
+
+    def test_stringify_comments(self):
+        inner = kurt.Block("forward:", 10)
+        inner.comment = "one\ntwo"
+        block = kurt.Block("doForever", [inner])
+        block.comment = "loop"
+        self.assertEqual(block.stringify(), "forever // loop\n"
+                                            "    move 10 steps // one\n"
+                                            "                  // two\n"
+                                            "end")
+
+    def test_intern(self):
+        table = kurt.BlockTable()
+        a = table.intern(kurt.Block("say:", kurt.Block("xpos")))
+        b = table.intern(kurt.Block("say:", kurt.Block("xpos")))
+        self.assertIs(a, b)
+        self.assertEqual(len(table), 2)
+
+    def test_shared_block_parents(self):
+        import gc
+        import weakref
+        table = kurt.BlockTable()
+        scripts = [table.intern(kurt.Script([kurt.Block("whenGreenFlag"),
+                                             kurt.Block("say:", i)]))
+                   for i in range(200)]
+        digests = map(lambda script: script.digest, scripts)
+        ref = weakref.ref(scripts.pop())
+        gc.collect()
+        self.assertIsNone(ref()) # not kept alive by the shared hat block
+
+        scripts[0].blocks[0].type = kurt.BlockType.get("whenIReceive")
+        self.assertNotEqual(scripts[-1].digest, digests[-2])
+
+
+class TestNormalize(unittest.TestCase):
+
+    def test_changed_sprite_is_normalized_again(self):
+        proj = kurt.Project()
+        sprite = kurt.Sprite(proj, "Sprite1")
+        proj.sprites.append(sprite)
+        sprite.scripts.append(kurt.Script([kurt.Block("forward:", 10)]))
+        proj.convert("scratch20")
+
+        sprite.scripts[0][0].args[0] = "20"
+        proj.convert("scratch20")
+        self.assertEqual(sprite.scripts[0][0].args, [20])
+
+    def test_comment_change_is_normalized(self):
+        proj = kurt.Project()
+        sprite = kurt.Sprite(proj, "Sprite1")
+        proj.sprites.append(sprite)
+        block = kurt.Block("forward:", 10)
+        sprite.scripts.append(kurt.Script([block]))
+        proj.convert("scratch20")
+
+        digest = sprite.scripts[0].digest
+        block.comment = "note"
+        self.assertEqual(sprite.scripts[0].digest, digest)
+        proj.convert("scratch20")
+        self.assertIsInstance(block.comment, unicode)
+
+
+class TestParser(unittest.TestCase):
+
+    def test_parse_in_threads(self):
+        import threading
+        proj = kurt.Project()
+        proj.stage.variables['foo'] = kurt.Variable()
+        program = "when gf clicked\nset foo to 1 * 2\nmove (10) steps"
+        expected = kurt.text.Parser(proj.stage).parse(program)
+
+        results = []
+        def parse():
+            parser = kurt.text.Parser(proj.stage)
+            for i in range(5):
+                results.append(parser.parse(program))
+        threads = [threading.Thread(target=parse) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [expected] * 20)
+
+    def test_token_trie_longest_match(self):
+        trie = kurt.text.TokenTrie(["go", "go to", "go to x:"])
+        self.assertEqual(trie.match("go to x: 10"), "go to x:")
+        self.assertEqual(trie.match("go tox"), "go")
+        self.assertEqual(trie.match("say go", 4), "go")
+        self.assertIsNone(trie.match("gone"))
+
+    def test_tokenize_context_names(self):
+        proj = kurt.Project()
+        proj.stage.variables['my score'] = kurt.Variable()
+        tokens = list(kurt.text.tokenize("change my score by 1", proj.stage))
+        self.assertIn("my score", [t.value for t in tokens])
+
+    def test_tokenize_comments(self):
+        parser = kurt.text.Parser(kurt.Project().stage)
+        list(parser.tokenize("say [x] // a\n// more\nsay [y]\n// b\n"))
+        self.assertEqual(parser.comments, {1: "a\nmore"})
+
+        script = parser.parse("say [x] // a\nsay [y]\n// b\n")
+        self.assertEqual([block.comment for block in script],
+                         ["a", ""])
+
+    def test_error_position(self):
+        program = "move (10) steps\nturn cw (15) degrees\n  ~~ what"
+        try:
+            kurt.text.parse(program, kurt.Project().stage)
+        except SyntaxError, err:
+            self.assertEqual(err.lineno, 3)
+            self.assertEqual(err.text, "  ~~ what")
+            self.assertEqual(err.offset, program.index("~~"))
+        else:
+            self.fail("SyntaxError not raised")
+
+    def test_blocks_by_parts(self):
+        parts = ["move", kurt.text.number("10"), "steps"]
+        blocks = list(kurt.text.blocks_by_parts(parts))
+        self.assertEqual([b.command for b in blocks], ["forward:"])
+        self.assertEqual(list(kurt.text.blocks_by_parts(parts[:2])), [])
+        parser = kurt.text.Parser(kurt.Project().stage)
+        self.assertIn("steps", set(parser.next_block_part(parts[:2])))
+
+    def test_parse_many(self):
+        proj = kurt.Project()
+        sprite = kurt.Sprite(proj, "Sprite1")
+        proj.sprites.append(sprite)
+        document = ("when gf clicked\nsay [hi]\n\n"
+                    "== Sprite1 ==\nwhen gf clicked\nmove (10) steps\n\n"
+                    "turn cw (15) degrees\n")
+        proj.parse(document)
+        self.assertEqual(len(proj.stage.scripts), 1)
+        self.assertEqual(len(sprite.scripts), 2)
+        self.assertEqual(sprite.scripts[1][0], kurt.Block("turnRight:", 15))
+
+        parser = kurt.text.Parser(proj.stage)
+        self.assertEqual(parser.parse_many(document, workers=2),
+                         parser.parse_many(document))
+
+        document += "\nmove (10) stepz\n"
+        try:
+            parser.parse_many(document)
+        except SyntaxError, err:
+            self.assertEqual(err.lineno, 10)
+            self.assertEqual(err.offset, document.index("stepz"))
+        else:
+            self.fail("SyntaxError not raised")
+
+
+class TestLayout(unittest.TestCase):
+
+    def make_scripts(self, count):
+        return [kurt.Script([kurt.Block("whenGreenFlag"),
+                             kurt.Block("doRepeat", 10, [
+                                 kurt.Block("forward:", 10)])])
+                for i in range(count)]
+
+    def test_clean_up(self):
+        layout = kurt.layout.Layout()
+        scripts = self.make_scripts(3)
+        layout.clean_up(scripts)
+        height = layout.size(scripts[0])[1]
+        self.assertEqual([s.pos for s in scripts],
+                         [(20, 20 + i * (height + 15)) for i in range(3)])
+
+    def test_packed_columns(self):
+        layout = kurt.layout.Layout(column_height=500)
+        scripts = self.make_scripts(50)
+        layout.clean_up(scripts)
+        for script in scripts:
+            (x, y) = script.pos
+            self.assertLessEqual(y + layout.size(script)[1], 520)
+        self.assertGreater(len(set(s.pos[0] for s in scripts)), 1)
+
+    def test_keep_positions(self):
+        scripts = self.make_scripts(3)
+        scripts[0].pos = (100, 200)
+        kurt.layout.Layout().clean_up(scripts, keep_positions=True)
+        self.assertEqual(scripts[0].pos, (100, 200))
+        self.assertGreater(scripts[1].pos[1], 200)
+        self.assertGreater(scripts[2].pos[1], scripts[1].pos[1])
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.folder)
+
+    def test_convert(self):
+        source = os.path.join(self.folder, "source")
+        os.makedirs(os.path.join(source, "sub"))
+        kurt.Project.load(os.path.join(SELF_PATH, 'game.sb')).save(
+                os.path.join(source, "sub", "game.sb"))
+        open(os.path.join(source, "broken.sb"), "wb").write("junk")
+        dest = os.path.join(self.folder, "dest")
+        manifest = os.path.join(self.folder, "manifest.jsonl")
+
+        records = kurt.batch.convert(source, dest, "scratch20", workers=2,
+                                     manifest=manifest)
+        self.assertEqual(sorted(r['status'] for r in records),
+                         ["failed", "ok"])
+        output = os.path.join(dest, "sub", "game.sb2")
+        self.assertTrue(os.path.exists(output))
+        self.assertFalse(os.path.exists(os.path.join(dest, "broken.sb2")))
+        kurt.Project.load(output)
+
+        self.assertEqual(kurt.batch.convert(source, dest, "scratch20",
+                                            manifest=manifest), [])
+        records = kurt.batch.convert(source, dest, "scratch20",
+                                     manifest=manifest, retry_failed=True)
+        self.assertEqual([r['source'] for r in records],
+                         [os.path.join(source, "broken.sb")])
+        self.assertEqual(len(kurt.batch.Manifest(manifest).records), 2)
+
+    def test_cache_size(self):
+        source = os.path.join(self.folder, "source")
+        os.makedirs(source)
+        project = kurt.Project.load(os.path.join(SELF_PATH, 'game.sb'))
+        for i in range(4):
+            project.variables['i'] = kurt.Variable(i)
+            project.save(os.path.join(source, "game%d.sb" % i))
+        output_size = len(project.to_bytes("scratch20"))
+
+        # each job runs in its own process, with its own copy of the cache
+        cache = kurt.cache.ConversionCache(os.path.join(self.folder, "cache"),
+                                           max_size=output_size * 2)
+        records = kurt.batch.convert(source, os.path.join(self.folder, "dest"),
+                                     "scratch20", workers=2, cache=cache)
+        self.assertEqual([r['status'] for r in records], ["ok"] * 4)
+        self.assertLessEqual(sum(size for (mtime, size, paths)
+                                 in cache._entries()), cache.max_size)
+
+
+class TestCorpus(unittest.TestCase):
+
+    def test_scan(self):
+        paths = [os.path.join(SELF_PATH, 'game.sb'),
+                 os.path.join(SELF_PATH, 'missing.sb')]
+        summaries = sorted(kurt.corpus.scan(paths, workers=2),
+                           key=lambda s: s['path'])
+        self.assertEqual(summaries, sorted(kurt.corpus.scan(paths, workers=0),
+                                           key=lambda s: s['path']))
+        (game, missing) = summaries
+        self.assertIsNone(game['error'])
+        self.assertEqual(game['format'], "scratch14")
+        self.assertEqual(game['sprites'], 1)
+        self.assertEqual(game['blocks']['doForever'], 1)
+        self.assertIsNotNone(missing['error'])
+
+        summary = kurt.corpus.summarize(paths[0], parts=["scripts"])
+        self.assertEqual(sorted(summary), ['error', 'path', 'scripts'])
+
+    def test_scan_dead_worker(self):
+        import signal
+        summarize = kurt.corpus.summarize
+        def killed(path, parts):
+            if path == "killed.sb": # as if out of memory
+                os.kill(os.getpid(), signal.SIGKILL)
+            return summarize(path, parts)
+        paths = ["killed.sb", os.path.join(SELF_PATH, 'game.sb')]
+        kurt.corpus.summarize = killed # the workers are forked with it
+        try:
+            summaries = dict((s['path'], s) for s in
+                             kurt.corpus.scan(paths, workers=1, timeout=1))
+        finally:
+            kurt.corpus.summarize = summarize
+        self.assertEqual(summaries["killed.sb"]['error'],
+                         "Timed out after 1 seconds")
+        self.assertIsNone(summaries[paths[1]]['error'])
+
+
+class TestIndex(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        import kurt.index
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.folder)
+
+    def test_update(self):
+        import shutil
+        path = os.path.join(self.folder, "game.sb")
+        shutil.copy(os.path.join(SELF_PATH, 'game.sb'), path)
+        index = kurt.index.Index(os.path.join(self.folder, "index.db"))
+        self.assertEqual(index.update([path]), 1)
+        self.assertEqual(index.projects_using("doForever"), [path])
+        self.assertEqual(index.projects_using("doForeverIf"), [])
+        self.assertEqual(index.update([path]), 0)
+
+        os.utime(path, (0, 0)) # same contents
+        self.assertEqual(index.update([path]), 0)
+
+        project = kurt.Project()
+        project.stage.scripts.append(kurt.Script([
+                kurt.Block("whenGreenFlag"),
+                kurt.Block("doForever", [kurt.Block("broadcast:", "go")])]))
+        project.save(path)
+        os.utime(path, (1, 1))
+        self.assertEqual(index.update([path]), 1)
+        self.assertEqual(index.projects_with_broadcast("go"), [path])
+        self.assertEqual(index.projects_with_script(project.stage.scripts[0]),
+                         [path])
+
+        os.remove(path)
+        index.prune()
+        self.assertEqual(index.query("SELECT COUNT(*) FROM blocks"), [(0,)])
+        index.close()
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def test_snapshot(self):
+        import tempfile
+        project = kurt.Project.load(os.path.join(SELF_PATH, 'game.sb'))
+        (handle, path) = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            project.save_snapshot(path)
+            restored = kurt.Project.load_snapshot(path)
+
+            with open(path, "wb") as fp:
+                fp.write("other data")
+                project.save_snapshot(fp)
+            with open(path, "rb") as fp:
+                fp.seek(len("other data"))
+                self.assertEqual(kurt.Project.load_snapshot(fp).stage.scripts,
+                                 project.stage.scripts)
+        finally:
+            os.remove(path)
+
+        self.assertEqual(restored.format, project.format)
+        for (a, b) in zip([project.stage] + project.sprites,
+                          [restored.stage] + restored.sprites):
+            self.assertEqual(a.name, b.name)
+            self.assertEqual(a.scripts, b.scripts)
+            self.assertEqual([c.image.size for c in a.costumes],
+                             [c.image.size for c in b.costumes])
+        self.assertIs(restored.sprites[0], restored.actors[
+                      project.actors.index(project.sprites[0])])
+
+        fp = StringIO()
+        restored.save_snapshot(fp)
+        fp.seek(0)
+        self.assertEqual(kurt.Project.load_snapshot(fp).stage.scripts,
+                         project.stage.scripts)
+        self.assertRaises(ValueError, kurt.Project.load_snapshot,
+                          StringIO("not a snapshot"))
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.folder)
+
+    def test_convert(self):
+        data = open(os.path.join(SELF_PATH, 'game.sb'), "rb").read()
+        cache = kurt.cache.ConversionCache(self.folder)
+        result = cache.convert(data, "scratch20", "scratch14")
+        self.assertEqual(cache.convert(data, "scratch20", "scratch14"),
+                         result)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        project = kurt.Project.load(StringIO(result[0]), format="scratch20")
+        self.assertEqual(project.sprites[0].name, "Sprite1")
+
+        key = cache.key(data, "scratch20", "scratch14")
+        self.assertNotEqual(cache.key(data, "scratch14", "scratch14"), key)
+        cache.evict(len(result[0]) - 1)
+        self.assertIsNone(cache.get(key))
+
+    def test_size(self):
+        cache = kurt.cache.ConversionCache(self.folder, max_size=1000)
+        entries = cache._entries
+        cache._entries = None # not measured until it's full
+        for i in range(9):
+            cache.put("%02d" % i, "x" * 98, [])
+        self.assertEqual(cache._total(), 900) # "[]" counts too
+
+        cache._entries = entries
+        cache.put("09", "x" * 198, [])
+        self.assertEqual(cache._total(), 900)
+        self.assertIsNone(cache.get("00"))
+        self.assertEqual(cache.get("09"), ("x" * 198, []))
+        self.assertEqual(kurt.cache.ConversionCache(self.folder)._total(),
+                         900)
+
+
+class TestServer(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        import kurt.server
+        self.folder = tempfile.mkdtemp()
+        self.start()
+
+    def start(self, **kwargs):
+        import threading
+        self.server = kurt.server.Server(("127.0.0.1", 0), workers=1,
+                                         **kwargs)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.client = kurt.server.Client(self.server.server_address,
+                                         token=self.server.token)
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def tearDown(self):
+        import shutil
+        self.stop()
+        shutil.rmtree(self.folder)
+
+    def test_jobs(self):
+        source = os.path.join(SELF_PATH, 'game.sb')
+        (output, warnings) = self.client.convert(source,
+                os.path.join(self.folder, "game.sb2"))
+        project = kurt.Project.load(output)
+        self.assertEqual(project.sprites[0].name, "Sprite1")
+
+        self.assertEqual(self.client.info(source)['format'], "scratch14")
+
+        handle = self.client.load(source)
+        (output, warnings) = self.client.save(handle,
+                os.path.join(self.folder, "copy.sb"))
+        self.assertEqual(kurt.Project.load(output).sprites[0].name, "Sprite1")
+        self.client.close(handle)
+        self.assertRaises(kurt.server.ServerError, self.client.save, handle,
+                          output)
+        self.assertRaises(kurt.server.ServerError, self.client.request, "foo")
+
+    def test_max_projects(self):
+        source = os.path.join(SELF_PATH, 'game.sb')
+        self.server.max_projects = 2
+        (first, second) = (self.client.load(source), self.client.load(source))
+        self.client.save(first, os.path.join(self.folder, "first.sb"))
+        self.client.load(source) # forgets the second
+        self.client.save(first, os.path.join(self.folder, "first.sb"))
+        self.assertRaises(kurt.server.ServerError, self.client.save, second,
+                          os.path.join(self.folder, "second.sb"))
+
+    def test_dead_worker(self):
+        import signal
+        convert = kurt.server._convert
+        def killed(source, output):
+            if source.endswith("killed.sb"): # as if out of memory
+                os.kill(os.getpid(), signal.SIGKILL)
+            return convert(source, output)
+        # so it's sent by name
+        (killed.__module__, killed.__name__) = ("kurt.server", "_convert")
+        self.stop()
+        kurt.server._convert = killed # the workers are forked with it
+        try:
+            self.start(timeout=1)
+            try:
+                self.client.convert("killed.sb", "killed.sb2")
+            except kurt.server.ServerError, err:
+                self.assertEqual(str(err), "Timed out after 1 seconds")
+            else:
+                self.fail("ServerError not raised")
+            self.client.convert(os.path.join(SELF_PATH, 'game.sb'),
+                                os.path.join(self.folder, "game.sb2"))
+        finally:
+            kurt.server._convert = convert
+
+    def test_token(self):
+        import httplib
+        source = os.path.join(SELF_PATH, 'game.sb')
+        client = kurt.server.Client(self.server.server_address, token="wrong")
+        self.assertRaises(kurt.server.ServerError, client.info, source)
+
+        # what a web page can send without a preflight
+        (host, port) = self.server.server_address
+        for headers in ({"Content-Type": "text/plain"},
+                        {"Content-Type": "text/plain",
+                         kurt.server.TOKEN_HEADER: self.server.token}):
+            connection = httplib.HTTPConnection(host, port)
+            connection.request("POST", "/",
+                    json.dumps({'job': "info", 'path': source}), headers)
+            self.assertEqual(connection.getresponse().status, 415)
+            connection.close()
+
+
+class TestJSONStream(unittest.TestCase):
+
+    def test_iter_object(self):
+        from kurt.scratch20 import jsonstream
+        obj = {"a": 123456, "children": [{"x": u"caf\xe9"}, [], 7.5, None],
+               "b": [1, {"c": "d"}], "e": {}}
+        data = json.dumps(obj, indent=1)
+        old_size = jsonstream.CHUNK_SIZE
+        jsonstream.CHUNK_SIZE = 3 # split values between reads
+        try:
+            members = []
+            for (key, value) in jsonstream.iter_object(StringIO(data),
+                                                       ["children"]):
+                if key == "children":
+                    value = list(value)
+                members.append((key, value))
+            self.assertEqual(dict(members), obj)
+
+            for (key, value) in jsonstream.iter_object(StringIO(data),
+                                                       ["children"]):
+                pass # children skipped
+            self.assertEqual(list(jsonstream.iter_object(StringIO("{}"))), [])
+            self.assertRaises(ValueError, list,
+                    jsonstream.iter_object(StringIO('{"a": [1, 2}')))
+
+            for size in range(1, 12): # numbers cut off anywhere
+                jsonstream.CHUNK_SIZE = size
+                data = '{"a": 1.25, "b": [-2e-3, 10]}'
+                self.assertEqual(dict(jsonstream.iter_object(StringIO(data))),
+                                 json.loads(data))
+        finally:
+            jsonstream.CHUNK_SIZE = old_size
+
+    def test_iter_object_invalid(self):
+        from kurt.scratch20 import jsonstream
+        rest = ", ".join(['"%s"' % ("x" * 100)] * 10000) + "]}"
+        for start in ('{"a": [1 2, ', '{"a": [1, xyz, ', '{"a": {"b": xyz, ',
+                      '{"a": ["\\q", '):
+            fp = StringIO(start + rest)
+            self.assertRaises(ValueError, list, jsonstream.iter_object(fp))
+            # gave up without reading the rest of the member
+            self.assertLessEqual(fp.tell(), jsonstream.CHUNK_SIZE * 2)
@@ -0,0 +1,85 @@
+#!/usr/bin/python
+#coding=utf8
+
+# Copyright © 2012 Tim Radvan
+#
+# This file is part of Kurt.
+#
+# Kurt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Kurt is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with Kurt. If not, see <http://www.gnu.org/licenses/>.
+
+"""Convert a folder of Scratch projects to another format.
+
+Usage: kurtconvert.py [options] "source folder" "dest folder" format
+
+Finished files are listed in a manifest (dest/manifest.jsonl by default),
+together with any errors and conversion warnings. Running the same command
+again skips the files in the manifest."""
+
+import os
+import sys
+import argparse
+
+ # try and find kurt directory
+path_to_file = os.path.join(os.getcwd(), __file__)
+path_to_lib = os.path.split(os.path.split(path_to_file)[0])[0]
+sys.path.append(path_to_lib)
+import kurt
+
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+            description="Convert a folder of Scratch projects.")
+    parser.add_argument("source", help="folder of projects")
+    parser.add_argument("dest", help="folder for the converted projects")
+    parser.add_argument("format", help="format to convert to, eg. scratch20")
+    parser.add_argument("-j", "--workers", type=int,
+            help="files to convert at once (default: number of CPUs)")
+    parser.add_argument("-t", "--timeout", type=float,
+            help="seconds to allow for each file")
+    parser.add_argument("-m", "--memory", type=int,
+            help="megabytes of memory to allow for each file")
+    parser.add_argument("--manifest",
+            help="manifest path (default: dest/manifest.jsonl)")
+    parser.add_argument("--retry-failed", action="store_true",
+            help="try the files which failed last time again")
+    parser.add_argument("--cache",
+            help="folder to cache converted files in")
+    args = parser.parse_args(argv)
+
+    manifest = args.manifest or os.path.join(args.dest, "manifest.jsonl")
+    if not os.path.isdir(args.dest):
+        os.makedirs(args.dest)
+
+    def report(record):
+        if record['status'] == "ok":
+            print "%s (%d warnings)" % (record['source'],
+                                        len(record['warnings']))
+        else:
+            print "%s FAILED: %s" % (record['source'], record['error'])
+
+    records = kurt.batch.convert(args.source, args.dest, args.format,
+            workers=args.workers, timeout=args.timeout,
+            memory_limit=args.memory and args.memory * 1024 * 1024,
+            manifest=manifest, retry_failed=args.retry_failed,
+            callback=report, cache=args.cache)
+
+    failed = [r for r in records if r['status'] != "ok"]
+    print "Converted %d files, %d failed." % (len(records) - len(failed),
+                                              len(failed))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,105 @@
+#!/usr/bin/python
+#coding=utf8
+
+# Copyright © 2012 Tim Radvan
+#
+# This file is part of Kurt.
+#
+# Kurt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Kurt is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Kurt. If not, see <http://www.gnu.org/licenses/>.
+
+"""Run a local conversion server, or send it a job.
+
+Usage: kurtserve.py serve [options]
+       kurtserve.py convert "source file" "output file"
+       kurtserve.py info "project file"
+"""
+
+import os
+import sys
+import json
+import argparse
+
+ # try and find kurt directory
+path_to_file = os.path.join(os.getcwd(), __file__)
+path_to_lib = os.path.split(os.path.split(path_to_file)[0])[0]
+sys.path.append(path_to_lib)
+import kurt
+import kurt.server
+
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+            description="Run a local conversion server, or send it a job.")
+    parser.add_argument("--host", default=kurt.server.DEFAULT_ADDRESS[0],
+            help="address of the server (default: %(default)s)")
+    parser.add_argument("-p", "--port", type=int,
+            default=kurt.server.DEFAULT_ADDRESS[1],
+            help="port of the server (default: %(default)s)")
+    parser.add_argument("--token-file", default=kurt.server.TOKEN_FILE,
+            help="file the server's token is kept in (default: %(default)s)")
+    commands = parser.add_subparsers(dest="command")
+
+    serve = commands.add_parser("serve", help="run the server")
+    serve.add_argument("-j", "--workers", type=int,
+            help="worker processes (default: number of CPUs)")
+    serve.add_argument("--cache", help="folder to cache converted files in")
+    serve.add_argument("--timeout", type=int, default=600,
+            help="seconds to give each job (default: %(default)s)")
+
+    convert = commands.add_parser("convert", help="convert a file")
+    convert.add_argument("source", help="project file")
+    convert.add_argument("output", help="path for the converted file")
+
+    info = commands.add_parser("info", help="summarise a project")
+    info.add_argument("path", help="project file")
+
+    args = parser.parse_args(argv)
+    address = (args.host, args.port)
+
+    if args.command == "serve":
+        server = kurt.server.Server(address, args.workers, args.cache,
+                                    timeout=args.timeout)
+        kurt.server.write_token(server.token, args.token_file)
+        print "Listening on %s:%d" % server.server_address
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        return 0
+
+    try:
+        token = kurt.server.read_token(args.token_file)
+    except IOError, err:
+        print "Error: can't read token (is the server running?): %s" % err
+        return 1
+    client = kurt.server.Client(address, token=token)
+    try:
+        if args.command == "convert":
+            (output, warnings) = client.convert(args.source, args.output)
+            for warning in warnings:
+                print warning
+            print output
+        else:
+            print json.dumps(client.info(args.path), indent=2, sort_keys=True)
+    except kurt.server.ServerError, err:
+        print "Error: %s" % err
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))